@@ -2,8 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import sys, os
-import pickle
 from network import *
+import genome_codec
+from checkpoint import generation_checkpoint
 import networkx as nx
 #from graph_tool.all import *
 
@@ -11,9 +12,9 @@ def population_analysis(n_nodes, genome_population):
 
     print(">>>>>>analysis of the whole population")
 
-    fit = [genome_population[j][1] for j in range(50)]
+    fit = [genome_population[j][1] for j in range(len(genome_population))]
     edges_max = n_nodes * (n_nodes-1) / 2.0
-    gen = [genome_population[j][0] for j in range(50)]
+    gen = [genome_population[j][0] for j in range(len(genome_population))]
 
     #1
     print("1 - fitness")
@@ -44,39 +45,33 @@ def population_analysis(n_nodes, genome_population):
     print()
 
 
-def create_network_net(n_nodes, connections_matrix):
+def create_network_net(n_nodes, genome):
     #create the network as a Network class and print its topology
 
     #generate network from genome 
     network = Network(n_nodes)
-    network.initialize_from_matrix(connections_matrix)
+    network.initialize_from_genome(genome)
     return network
 
 
-def create_graphtool_net(n_nodes, connections_matrix):
+def create_graphtool_net(n_nodes, genome):
     #using graphtool library!
     g = Graph(directed=False)
     #add vertex
     vlist = g.add_vertex(n_nodes)
 
     #add edges
-    position = 0 #current position in genome array
-    for i in range(n_nodes):
-        for j in range(i):
-            if connections_matrix[position] == 1:
-                g.add_edge(g.vertex(i), g.vertex(j))
-            position += 1
+    lines, columns = genome_codec.decode(sorted(genome)) #in the order of the connections matrix
+    for i, j in zip(lines.tolist(), columns.tolist()):
+        g.add_edge(g.vertex(i), g.vertex(j))
 
     return g
 
-def create_networkx_net(n_nodes, connections_matrix):
+def create_networkx_net(n_nodes, genome):
     g = nx.Graph()
 
-    position = 0
-    for i in range(n_nodes):
-        for j in range(i):
-            if connections_matrix[position] == 1:
-                g.add_edge(i, j)
+    lines, columns = genome_codec.decode(sorted(genome)) #in the order of the connections matrix
+    g.add_edges_from(zip(lines.tolist(), columns.tolist()))
     return g
 
 def draw_graphtool(graph):
@@ -112,34 +107,32 @@ def graphtool_analysis(graph):
 
 def main(argv):
 
-    if len(argv) != 3:
-        print("usage: analyse_result [n_nodes] [pickle_file]")
+    if len(argv) not in (3, 4):
+        print("usage: analyse_result [n_nodes] [checkpoint_file] [generation (default: the last one)]")
         return
 
     n_nodes = int(argv[1]) #number of nodes in the network
-    bkp_file = open(argv[2], "rb")
-    genome_population = pickle.load(bkp_file)
+    #population saved by phase2_evolution.py (see checkpoint.py), memory-mapped
+    checkpoint = generation_checkpoint(argv[2], int(argv[3]) if len(argv) == 4 else None)
+    if checkpoint is None:
+        print("no complete checkpoint of this generation in", argv[2])
+        return
+    print(">>>>>>generation", checkpoint.generation)
+    genome_population = [[genome.tolist(), fitness] for genome, fitness in zip(checkpoint.genomes, checkpoint.fitness.tolist())]
     pop_size = len(genome_population)
-    genome = genome_population[-1][0] #get the last genome, to test. if the list is initialized, it will contain the best individual
-    matrix_size = int(((n_nodes - 1)*n_nodes)/2) #this is the size of the triangular region lower to the main diagonal of the matrix.
-
-    #generate connections_matrix, from the genome
-    connections_matrix = [0] * matrix_size #initialize with zeroes 
-    for connection in genome:
-        connections_matrix[connection] = 1 #replace to 1, the edges indicated in the genome
-
+    genome = genome_population[-1][0] #get the last genome, to test. the checkpoints are sorted by fitness: it is the best individual
     #analyse population
     population_analysis(n_nodes, genome_population)
     #connections_frequency(genome_population)
 
     #create Network object
-    #net = create_network_net(n_nodes, connections_matrix)
+    #net = create_network_net(n_nodes, genome)
     #net.print_network(True)
 
-    netx = create_networkx_net(n_nodes, connections_matrix)
+    netx = create_networkx_net(n_nodes, genome)
     draw_dot_netx(netx)
     #Create graphtool object
-    #g = create_graphtool_net(n_nodes, connections_matrix)
+    #g = create_graphtool_net(n_nodes, genome)
 
     #draw_graphtool(graph):
     #draw_dot(graph):
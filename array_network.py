@@ -0,0 +1,502 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Array-backed simulation engine.
+
+ArrayNetwork keeps the per-node state (values, status, transactional_energy,
+candidates, endanger, is_alive) in contiguous NumPy arrays, over a Topology that
+holds the connections in a CSR adjacency (indptr/indices) and is compiled once
+and shared by every test of a network. It can be used wherever a Network is run:
+run(), update_network(), count_survivors(), get_values() and the NoiseControl
+functions behave the same.
+
+Equivalence with Network.run / Network.update_network:
+ - First round: status, transactional_energy and candidates are computed with
+   the same comparisons, over live neighbours only (a dead node has no
+   connections in the object model).
+ - Second round: in Network.run the askers are visited in node order, and each
+   one takes from every offering neighbour a share transactional_energy/candidates
+   of that neighbour, scaled by min(1, needed/available). Taking less than the
+   share raises the share left for the next askers of the same offerer, so the
+   order matters. Here the askers are processed in waves: an asker joins a wave
+   once every lower numbered asker sharing one of its offerers was served. The
+   askers of a wave never share an offerer, so they are served all at once,
+   each offerer sees its askers in the same order as in Network.run, and each
+   asker takes from its offerers in the order of its connections.
+ - update_network applies the same endanger/death rules; a death only clears
+   the alive flag, which removes the node from every neighbourhood.
+ - GlobalNetwork keeps its own transfer rule (every asker is connected to every
+   offerer), as in GlobalNetwork.run.
+ - Rings (LocalNetwork) and grids (VonNeumannNetwork) run the first round as a
+   stencil: the state of the k-th neighbour of every node is a shifted copy of
+   the state, and the pairs come out in the same order as the generic kernel's.
+   The second round stays on the waves above: the serving order chains the
+   askers of a ring or grid into about twenty waves per step, and a stencil
+   pass costs a sweep over the whole state per wave, where the wave kernel only
+   gathers the pairs left (a stencil second round, exact as well, was slower).
+Every sum is accumulated in the same order as in the object model, so the
+results are the same, bit for bit.
+"""
+
+import numpy as np
+import genome_codec
+from network import Network, GlobalNetwork, LocalNetwork, VonNeumannNetwork
+
+
+_rng = np.random.default_rng()
+
+
+def _first_round(values, alive, src, dst, lower_limit, upper_limit):
+    #values and alive are (trials x nodes) matrices, src and dst the connections shared by all trials
+    #each node decides to: 1-ask energy from neighbours 2-offer energy to neighbours 0-stay as it is
+    n_nodes = values.shape[1]
+    asking = values < lower_limit
+    offering = ~asking & (values > upper_limit)
+    status = np.where(asking, 1, np.where(offering, 2, 0)).astype(np.int8)
+    transactional_energy = np.where(asking, lower_limit - values, np.where(offering, values - upper_limit, 0.0))
+
+    #connections from or to dead nodes don't exist anymore
+    live = alive[:, src] & alive[:, dst]
+
+    #askers count neighbours above the upper limit, offerers count neighbours below the lower limit
+    ask_edges = live & asking[:, src] & (values[:, dst] > upper_limit)
+    offer_edges = live & offering[:, src] & asking[:, dst]
+    trial, edge = np.nonzero(ask_edges | offer_edges)
+    candidates = np.bincount(trial*n_nodes + src[edge], minlength=values.size).astype(np.float64).reshape(values.shape)
+
+    #pairs (asker, offerer) where energy will be transfered, sorted by asker (as flat indexes of the state matrix)
+    trial, edge = np.nonzero(ask_edges & (status[:, dst] == 2))
+    return status, transactional_energy, candidates, trial*n_nodes + src[edge], trial*n_nodes + dst[edge]
+
+
+def _first_round_stencil(values, alive, stencil, neighbours, lower_limit, upper_limit):
+    #_first_round for a topology where the k-th neighbour of every node is given by the same shift of the state (see
+    #Topology.set_stencil): the neighbours' state comes from rolling the state, instead of gathering it edge by edge
+    trials, n_nodes = values.shape
+    shape, shifts = stencil
+    asking = values < lower_limit
+    offering = ~asking & (values > upper_limit)
+    status = np.where(asking, 1, np.where(offering, 2, 0)).astype(np.int8)
+    transactional_energy = np.where(asking, lower_limit - values, np.where(offering, values - upper_limit, 0.0))
+
+    candidates = np.zeros(values.shape)
+    pairs = np.empty((trials, n_nodes, len(shifts)), dtype=bool)
+    for k, (axis, amount) in enumerate(shifts):
+        shift = lambda x: np.roll(x.reshape((trials,) + shape), amount, axis=axis + 1).reshape(trials, n_nodes)
+        #connections from or to dead nodes don't exist anymore
+        live = alive & shift(alive)
+        #askers count neighbours above the upper limit, offerers count neighbours below the lower limit
+        ask = live & asking & (shift(values) > upper_limit)
+        candidates += ask | (live & offering & shift(asking))
+        pairs[:, :, k] = ask & shift(offering)
+
+    #pairs (asker, offerer), sorted by asker and then in the order of the asker's connections
+    trial, node, k = np.nonzero(pairs)
+    return status, transactional_energy, candidates, trial*n_nodes + node, trial*n_nodes + neighbours[node, k]
+
+
+def _second_round(values, transactional_energy, candidates, askers, offerers):
+    #performs the energy transactions, one wave of independent askers at a time
+    #the state is flattened, so the trials of an ensemble are just disconnected parts of one big network
+    if len(askers) == 0:
+        return
+    size = values.size
+    values = values.reshape(-1)
+    transactional_energy = transactional_energy.reshape(-1)
+    candidates = candidates.reshape(-1)
+
+    #rank of each pair among the askers of its offerer (askers are served in node order)
+    order = np.argsort(offerers, kind='stable')
+    sorted_offerers = offerers[order]
+    group_start = np.flatnonzero(np.r_[True, sorted_offerers[1:] != sorted_offerers[:-1]])
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - np.repeat(group_start, np.diff(np.r_[group_start, len(order)]))
+
+    served = np.zeros(size, dtype=np.int64) #amount of askers each offerer already served
+    while len(askers) > 0:
+        #an asker is blocked if any of its offerers still has to serve a lower numbered asker
+        blocked = np.zeros(size, dtype=bool)
+        blocked[askers[rank != served[offerers]]] = True
+        ready = ~blocked[askers]
+        if not ready.any():
+            #only a repeated connection (see Topology.from_edges) can keep every asker waiting for itself
+            raise ValueError("repeated connections in the topology")
+        a = askers[ready]
+        o = offerers[ready]
+
+        #position of each pair in the connections of its asker (pairs are sorted by asker)
+        asker_start = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+        position = np.arange(len(a)) - np.repeat(asker_start, np.diff(np.r_[asker_start, len(a)]))
+
+        energy_offered = transactional_energy[o] / candidates[o] #to be fair, the node will just receive a fraction of the neighbour's spare energy
+        energy_avaiable = np.bincount(a, energy_offered, minlength=size) #first, check how much energy is avaiable in total
+        for j in range(position.max() + 1): #then take it from each neighbour, in the order of the connections
+            step = position == j
+            node = a[step]
+            neighbour = o[step]
+            offered = energy_offered[step]
+            needed = transactional_energy[node]
+            avaiable = energy_avaiable[node]
+            #if the total energy avaiable is less than what the node needs, the node accepts all the energy being offered
+            #when there is more energy avaiable than needed, the node gets energy from its neighbours proportional to the offered amount
+            energy_transmited = np.where(avaiable <= needed, offered, needed * (offered / np.where(avaiable <= needed, 1.0, avaiable)))
+            values[node] += energy_transmited #needy node gets energy
+            energy_avaiable[node] -= offered
+            transactional_energy[node] -= energy_transmited
+            candidates[node] -= 1.0
+            values[neighbour] -= energy_transmited #rich node looses energy
+            transactional_energy[neighbour] -= energy_transmited
+            candidates[neighbour] -= 1.0
+
+        served[o] += 1
+        askers = askers[~ready]
+        offerers = offerers[~ready]
+        rank = rank[~ready]
+
+
+def _global_round(values, status, transactional_energy):
+    #GlobalNetwork.run: every asker is connected to every offerer
+    empty_nodes = np.flatnonzero(status == 1)
+    full_nodes = np.flatnonzero(status == 2)
+    empty_candidates = len(empty_nodes)
+    energy_avaiable = float(np.cumsum(transactional_energy[full_nodes])[-1]) if len(full_nodes) else 0.0 #summed in node order
+    original_energy_avaiable = energy_avaiable #backup
+
+    needed = transactional_energy[empty_nodes].tolist()
+    transmited = [0.0] * empty_candidates
+    for k in range(empty_candidates):
+        energy_per_node = energy_avaiable / empty_candidates
+        transmited[k] = min(energy_per_node, needed[k])
+        empty_candidates -= 1
+        energy_avaiable -= transmited[k]
+    values[empty_nodes] += transmited
+    transactional_energy[empty_nodes] -= transmited
+
+    if original_energy_avaiable != 0:
+        energy_used = 1 - (energy_avaiable / original_energy_avaiable)
+    else:
+        energy_used = 0
+    values[full_nodes] -= energy_used * transactional_energy[full_nodes] #rich node looses energy
+    return len(empty_nodes) * len(full_nodes)
+
+
+class Topology:
+    """Compiled, immutable connections of a network, in CSR format (the neighbours of node i are indices[indptr[i]:indptr[i+1]]).
+        Built once per genome (or per generated network) and shared by every test: the per-test state comes from
+        fresh_state()/fresh_ensemble(), and deaths are kept in that state, never in the topology.
+        Regular topologies (rings and grids, see set_stencil) run the first round with shifted copies of the state
+        (the transfers of the second round are the same for every topology).
+        The arrays are used as given (int32 or int64, e.g. views of a TopologyBank), not copied: they must not change afterwards.
+        Parameters: n_nodes, indptr, indices, fully_connected (use the GlobalNetwork transfer rule, ignoring the adjacency),
+                    stencil (see set_stencil; trusted as given), sources (see below; computed from indptr if not given)"""
+    def __init__(self, n_nodes, indptr, indices, fully_connected=False, stencil=None, sources=None):
+        self.n_nodes = n_nodes
+        self.indptr = np.asarray(indptr).view()
+        self.indices = np.asarray(indices).view()
+        self.fully_connected = fully_connected
+        #source node of each CSR entry, to work on edges without looping over nodes
+        if sources is None:
+            sources = np.repeat(np.arange(n_nodes, dtype=self.indices.dtype), np.diff(self.indptr))
+        self.sources = np.asarray(sources).view()
+        for array in (self.indptr, self.indices, self.sources): #(read-only views: the arrays of the caller keep their flags)
+            array.setflags(write=False)
+        self.stencil = None
+        if stencil is not None:
+            self.stencil = stencil
+            self.neighbours = self.indices.reshape(n_nodes, -1) #k-th neighbour of each node
+
+    def set_stencil(self, shape, shifts):
+    #use the stencil kernel if the connections of every node are the same shifts of the nodes laid out in shape: the k-th
+    #connection of each node is np.roll(nodes.reshape(shape), shifts[k][1], axis=shifts[k][0]), for every node, in this order
+    #returns whether the connections match (otherwise the generic kernel is kept)
+        if int(np.prod(shape)) != self.n_nodes or len(self.indices) != self.n_nodes * len(shifts) or self.fully_connected:
+            return False
+        nodes = np.arange(self.n_nodes).reshape(shape)
+        table = np.stack([np.roll(nodes, amount, axis=axis).ravel() for axis, amount in shifts], axis=1)
+        if not np.array_equal(table.ravel(), self.indices):
+            return False
+        self.stencil = (tuple(shape), tuple(shifts))
+        self.neighbours = self.indices.reshape(self.n_nodes, -1)
+        return True
+
+    def first_round(self, values, alive, lower_limit, upper_limit):
+        #status, transactional_energy, candidates and the (asker, offerer) pairs of a (trials x nodes) state, see _first_round
+        if self.stencil is not None:
+            return _first_round_stencil(values, alive, self.stencil, self.neighbours, lower_limit, upper_limit)
+        return _first_round(values, alive, self.sources, self.indices, lower_limit, upper_limit)
+
+    @classmethod
+    def from_edges(cls, n_nodes, src, dst, fully_connected=False):
+    #from directed (src, dst) connections; the connections of a node keep their order
+    #a repeated connection is only kept once, where it first appears (as in the connections dict of a Node)
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        keys, first = np.unique(src * n_nodes + dst, return_index=True)
+        if len(first) < len(src):
+            first.sort()
+            src, dst = src[first], dst[first]
+        order = np.argsort(src, kind='stable')
+        indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+        return cls(n_nodes, indptr, dst[order], fully_connected)
+
+    @classmethod
+    def from_genome(cls, n_nodes, genome):
+    #same connections as Network.initialize_from_genome (and in the same order)
+        line, column = genome_codec.decode(genome)
+
+        #each gene appends column to line's connections, then line to column's connections
+        src = np.column_stack((line, column)).ravel()
+        dst = np.column_stack((column, line)).ravel()
+        return cls.from_edges(n_nodes, src, dst)
+
+    @classmethod
+    def from_network(cls, network):
+    #connections of a Network object (any of the topology classes)
+        degrees = [len(node.connections) for node in network.nodes]
+        indptr = np.zeros(network.n_nodes + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+        indices = np.fromiter((c for node in network.nodes for c in node.connections), dtype=np.int64, count=int(indptr[-1]))
+        topology = cls(network.n_nodes, indptr, indices, isinstance(network, GlobalNetwork))
+
+        #regular topologies use the stencil kernel (when their connections really are the regular ones)
+        if isinstance(network, LocalNetwork) and network.n_nodes > 0:
+            #the neighbours of node i are i + the offsets of node 0 (in the ring)
+            offsets = topology.indices[topology.indptr[0]:topology.indptr[1]]
+            topology.set_stencil((network.n_nodes,), [(0, -int(offset)) for offset in offsets])
+        elif isinstance(network, VonNeumannNetwork):
+            #left, right, up and down (see VonNeumannNetwork)
+            topology.set_stencil((network.grid_lines, network.grid_columns), [(1, 1), (1, -1), (0, 1), (0, -1)])
+        return topology
+
+    def to_network(self):
+    #Network with these connections (a GlobalNetwork if fully_connected), with every node alive, with value 0
+        if self.fully_connected:
+            return GlobalNetwork(self.n_nodes)
+        network = Network(self.n_nodes)
+        for i, node in enumerate(network.nodes):
+            node.connections = dict.fromkeys(self.indices[self.indptr[i]:self.indptr[i+1]].tolist())
+        return network
+
+    @classmethod
+    def stack(cls, topologies):
+    #the networks of every topology side by side, as disconnected parts of one network (nodes of the k-th after those of the first k-1)
+        if any(topology.fully_connected for topology in topologies):
+            raise ValueError("fully connected topologies can't be stacked")
+        offsets = np.cumsum([0] + [topology.n_nodes for topology in topologies])
+        edges = np.cumsum([0] + [len(topology.indices) for topology in topologies])
+        indptr = np.concatenate([[0]] + [topology.indptr[1:] + edges[k] for k, topology in enumerate(topologies)])
+        indices = np.concatenate([topology.indices + offsets[k] for k, topology in enumerate(topologies)])
+        return cls(int(offsets[-1]), indptr, indices)
+
+    def fresh_state(self):
+        #a network with this topology and every node alive, with value 0
+        return ArrayNetwork(self)
+
+    def fresh_ensemble(self, n_trials):
+        #n_trials networks with this topology, see fresh_state
+        return EnsembleNetwork(self, n_trials)
+
+
+class ArrayNetwork:
+    """Network with the node state stored in NumPy arrays, over a compiled Topology
+        Parameters: topology"""
+    def __init__(self, topology):
+        self.topology = topology
+        self.n_nodes = topology.n_nodes
+        self.reset()
+
+    @classmethod
+    def from_genome(cls, n_nodes, genome):
+        return cls(Topology.from_genome(n_nodes, genome))
+
+    @classmethod
+    def from_network(cls, network):
+    #copy a Network (any of the topology classes), including its current state
+        array_network = cls(Topology.from_network(network))
+
+        array_network.values[:] = [node.value for node in network.nodes]
+        array_network.status[:] = [node.status for node in network.nodes]
+        array_network.transactional_energy[:] = [node.transactional_energy for node in network.nodes]
+        array_network.candidates[:] = [node.candidates for node in network.nodes]
+        array_network.endanger[:] = [node.endanger for node in network.nodes]
+        array_network.is_alive[:] = [node.is_alive for node in network.nodes]
+        array_network.values_list[:] = network.values_list
+        array_network.endangered = network.endangered
+        return array_network
+
+    def reset(self):
+        #zeroed state, as in a new Network
+        self.values = np.zeros(self.n_nodes)
+        self.status = np.zeros(self.n_nodes, dtype=np.int8)
+        self.transactional_energy = np.zeros(self.n_nodes)
+        self.candidates = np.zeros(self.n_nodes)
+        self.endanger = np.zeros(self.n_nodes, dtype=np.int64)
+        self.is_alive = np.ones(self.n_nodes, dtype=bool)
+        self.values_list = np.zeros(self.n_nodes)
+        self.endangered = 0 #live nodes out of the safe energy levels, after the last update_network
+
+    def run(self, lower_limit, upper_limit):
+    #run the network, allowing energy transfusions (see Network.run)
+    #returns the number of transfers (pairs asking/offering node) that happened
+        topology = self.topology
+        status, transactional_energy, candidates, askers, offerers = topology.first_round(self.values[None], self.is_alive[None], lower_limit, upper_limit)
+        self.status = status[0]
+        self.transactional_energy = transactional_energy[0]
+        if topology.fully_connected:
+            return _global_round(self.values, self.status, self.transactional_energy)
+        self.candidates = candidates[0]
+        _second_round(self.values, self.transactional_energy, self.candidates, askers, offerers)
+        return len(askers)
+
+    def update_network(self, lower_limit, upper_limit, endanger_limit):
+        #check which nodes are under or above the safe energy levels
+        #returns the number of nodes that died (self.endangered keeps how many live nodes are out of the safe levels)
+        self.values_list = self.values.copy()
+        out_of_limits = (self.values < lower_limit) | (self.values > upper_limit)
+        self.endanger = np.where(self.is_alive, np.where(out_of_limits, self.endanger + 1, 0), self.endanger)
+        #kill nodes in endanger condition for too many generations
+        dying = self.is_alive & (self.endanger >= endanger_limit)
+        self.is_alive &= ~dying
+        self.endangered = int(np.count_nonzero(self.is_alive & (self.endanger > 0)))
+        return int(np.count_nonzero(dying))
+
+    def remove_node(self, node_index):
+        #the node loses all its connections, in this state only (the topology is shared)
+        self.is_alive[node_index] = False
+
+    def count_survivors(self):
+        return int(np.count_nonzero(self.is_alive))
+
+    def get_values(self):
+        return self.values_list.tolist()
+
+    def apply_regular_noise(self, noise):
+        self.values[:] = noise
+
+    def apply_random_noise(self, predefined_noise=[], noise_range=100, negative_range=True):
+        if len(predefined_noise): #if it is just applying a noise created befoere in random_noise_generator
+            self.values += predefined_noise
+        elif negative_range:
+            self.values += _rng.integers(-noise_range, noise_range, self.n_nodes) #generate either a positive or a negative value
+        else:
+            self.values += np.where(self.is_alive, _rng.integers(0, noise_range, self.n_nodes), 0) #generate only positive values
+
+    def print_network(self, show_connections=False):
+        indptr, indices = self.topology.indptr, self.topology.indices
+        values_str = ''
+        for i in range(self.n_nodes):
+            if show_connections:
+                connections = indices[indptr[i]:indptr[i+1]]
+                if not self.is_alive[i]:
+                    connections = connections[:0]
+                else:
+                    connections = connections[self.is_alive[connections]]
+                print('node ' + str(i) + ' is connected to: ' + ', '.join(str(x) for x in connections))
+            values_str += str(round(self.values[i])) + ' '
+        print(values_str)
+
+
+class EnsembleNetwork:
+    """Independent trials of the same topology, advanced together as a (trials x nodes) state matrix.
+        Each row follows the same rules as an ArrayNetwork. Trials that are over can be retired, so the
+        next steps only work on the active ones.
+        Parameters: topology, n_trials"""
+    def __init__(self, topology, n_trials):
+        self.topology = topology
+        self.n_nodes = topology.n_nodes
+        self.n_trials = n_trials
+        self.reset()
+
+    @classmethod
+    def from_genome(cls, n_nodes, genome, n_trials):
+        return cls(Topology.from_genome(n_nodes, genome), n_trials)
+
+    @classmethod
+    def from_network(cls, network, n_trials):
+    #n_trials of the topology of a Network (the state of its nodes is not copied)
+        return cls(Topology.from_network(network), n_trials)
+
+    def reset(self):
+        #every trial active again, with a zeroed state
+        shape = (self.n_trials, self.n_nodes)
+        self.trials = np.arange(self.n_trials) #trials still running (rows of the state matrices)
+        self.final_alive = np.zeros((self.n_trials, self.n_nodes), dtype=bool) #live nodes of the retired trials, when they were retired
+        self.values = np.zeros(shape)
+        self.status = np.zeros(shape, dtype=np.int8)
+        self.transactional_energy = np.zeros(shape)
+        self.candidates = np.zeros(shape)
+        self.endanger = np.zeros(shape, dtype=np.int64)
+        self.is_alive = np.ones(shape, dtype=bool)
+        self.values_list = np.zeros(shape)
+        self.endangered = np.zeros(self.n_trials, dtype=np.int64) #per active trial, see ArrayNetwork
+
+    def run(self, lower_limit, upper_limit):
+    #one step of every active trial (see Network.run)
+    #returns the number of transfers of each active trial
+        topology = self.topology
+        status, transactional_energy, candidates, askers, offerers = topology.first_round(self.values, self.is_alive, lower_limit, upper_limit)
+        self.status = status
+        self.transactional_energy = transactional_energy
+        if topology.fully_connected:
+            return np.array([_global_round(self.values[i], status[i], transactional_energy[i]) for i in range(len(self.trials))], dtype=np.int64)
+        self.candidates = candidates
+        _second_round(self.values, transactional_energy, candidates, askers, offerers)
+        return np.bincount(askers // self.n_nodes, minlength=len(self.trials))
+
+    def update_network(self, lower_limit, upper_limit, endanger_limit):
+        #check which nodes are under or above the safe energy levels
+        #returns the number of nodes that died in each active trial
+        self.values_list = self.values.copy()
+        out_of_limits = (self.values < lower_limit) | (self.values > upper_limit)
+        self.endanger = np.where(self.is_alive, np.where(out_of_limits, self.endanger + 1, 0), self.endanger)
+        #kill nodes in endanger condition for too many generations
+        dying = self.is_alive & (self.endanger >= endanger_limit)
+        self.is_alive &= ~dying
+        self.endangered = np.count_nonzero(self.is_alive & (self.endanger > 0), axis=1)
+        return np.count_nonzero(dying, axis=1)
+
+    def retire(self, finished):
+    #stop running the active trials flagged in finished; returns the mask of the trials that keep running
+        finished = np.asarray(finished, dtype=bool)
+        if finished.any():
+            self.final_alive[self.trials[finished]] = self.is_alive[finished]
+            keep = ~finished
+            self.trials = self.trials[keep]
+            self.values = self.values[keep]
+            self.status = self.status[keep]
+            self.transactional_energy = self.transactional_energy[keep]
+            self.candidates = self.candidates[keep]
+            self.endanger = self.endanger[keep]
+            self.is_alive = self.is_alive[keep]
+            self.values_list = self.values_list[keep]
+            self.endangered = self.endangered[keep]
+        return ~finished
+
+    def count_alive(self):
+        #survivors of each active trial
+        return np.count_nonzero(self.is_alive, axis=1)
+
+    def alive_matrix(self):
+        #(trials x nodes) live nodes of every trial (the active ones as they are now)
+        alive = self.final_alive.copy()
+        alive[self.trials] = self.is_alive
+        return alive
+
+    def count_survivors(self):
+        #survivors of every trial
+        return np.count_nonzero(self.alive_matrix(), axis=1)
+
+    def get_values(self):
+        return self.values_list.copy()
+
+    def apply_regular_noise(self, noise):
+        self.values[:] = noise
+
+    def apply_random_noise(self, predefined_noise=[], noise_range=100, negative_range=True):
+        shape = self.values.shape
+        if len(predefined_noise): #one row of noise per active trial (or a single row shared by all of them)
+            self.values += predefined_noise
+        elif negative_range:
+            self.values += _rng.integers(-noise_range, noise_range, shape) #generate either a positive or a negative value
+        else:
+            self.values += np.where(self.is_alive, _rng.integers(0, noise_range, shape), 0) #generate only positive values
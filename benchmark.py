@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmarks of the simulation kernels, the generators and the evaluation of the evolution scripts.
+
+    python benchmark.py                           run every benchmark and print its time
+    python benchmark.py --save baseline.json      ... and save the times as a baseline
+    python benchmark.py --compare baseline.json   ... and flag the ones slower than the baseline by more than --threshold
+
+--quick only uses networks of 10^2 and 10^3 nodes, --filter TEXT only runs the
+benchmarks with TEXT in their name. Each benchmark is run --repeat times (fast
+ones more, see _MIN_TIME), from a new setup each time (not timed), and keeps its
+best time: the least disturbed by the rest of the machine. Everything runs in this process, with fixed seeds,
+and only needs NumPy. The exit status is 1 when a regression is flagged.
+
+    run/<class>/<nodes>          one Network.run + update_network of the class of network.py
+    run_array/<class>/<nodes>    the same, with the array engine (array_network.py)
+    build/<class>/<nodes>        construction of a network of the class of network.py (as in rules_evolution.py and TopologyBank)
+    generate/<kind>/<nodes>      edges of a topology of generators.py
+    run_individual/<engine>      evaluation of a genome by phase2_evolution.py (_BENCH_TESTS tests)
+    rules_iteration              test of a candidate by rules_evolution.py (_BENCH_TESTS tests)
+    evolution_step               Evolution.step of phase2_evolution.py (_BENCH_POPULATION individuals, serial)
+"""
+
+import sys
+import io
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import contextlib
+import datetime
+import numpy as np
+
+import network
+import generators
+import genome_codec
+import evaluator
+import phase2_evolution
+import rules_evolution
+from array_network import Topology
+from noise_bank import NoiseBank
+from topology_bank import TopologyBank
+from seeding import Seeding
+
+
+_SIZES = (10**2, 10**3, 10**4, 10**5)  #network sizes of the kernel and generator benchmarks
+_QUICK_SIZES = (10**2, 10**3)
+_REPEAT = 3                            #runs of each benchmark (the best time is kept)
+_MIN_TIME = 0.1                        #fast benchmarks run more times, until their runs add up to this time (seconds)
+_MAX_REPEAT = 1000
+_THRESHOLD = 0.2                       #slowdown (fraction of the baseline time) flagged as a regression
+_BENCH_TESTS = 20                      #tests per individual/candidate in the evaluation benchmarks
+_BENCH_POPULATION = 10                 #individuals of the evolution_step benchmark
+_SEED = 0
+
+
+def _grid(n_nodes):
+    #lines and columns of a von Neumann grid of n_nodes (as square as possible)
+    lines = int(np.sqrt(n_nodes))
+    while n_nodes % lines:
+        lines -= 1
+    return lines, n_nodes // lines
+
+
+def _networks(n_nodes):
+    #constructors of the classes of network.py (with the parameters of rules_evolution.py) and their generators.py equivalent
+    lines, columns = _grid(n_nodes)
+    return [
+        ("local", lambda: network.LocalNetwork(n_nodes, 4), ("local", 4)),
+        ("small_world", lambda: network.SmallWorldNetwork(n_nodes, 4, 0.04), ("small_world", 4, 0.04)),
+        ("random", lambda: network.RandomNetwork(n_nodes, 2 * n_nodes), ("random", 2 * n_nodes)),
+        ("global", lambda: network.GlobalNetwork(n_nodes), ("global",)),
+        ("von_neumann", lambda: network.VonNeumannNetwork(n_nodes, lines, columns), ("von_neumann", lines, columns)),
+        ("scale_free", lambda: network.ScaleFreeNetwork(n_nodes, 10, 2), ("scale_free", 10, 2)),
+    ]
+
+
+@contextlib.contextmanager
+def _constants(module, **values):
+    #module constants replaced while the block runs (to reduce the size of the evaluation benchmarks)
+    old = {name: getattr(module, name) for name in values}
+    for name, value in values.items():
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for name, value in old.items():
+            setattr(module, name, value)
+
+
+def best_time(setup, run, repeat, teardown=None):
+    #best time of run(setup()) in at least repeat runs (more for fast runs, see _MIN_TIME)
+    best = float("inf")
+    total = 0.0
+    runs = 0
+    while runs < repeat or (total < _MIN_TIME and runs < _MAX_REPEAT):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        seconds = time.perf_counter() - start
+        if teardown is not None:
+            teardown(state)
+        best = min(best, seconds)
+        total += seconds
+        runs += 1
+    return best
+
+
+def _kernel(create, array_engine):
+    #one iteration of a network with random values (as after the initial noise of rules_evolution.py)
+    def setup():
+        random.seed(_SEED)
+        net = create()
+        if array_engine:
+            net = Topology.from_network(net).fresh_state()
+        network.NoiseControl.apply_random_noise(net, np.random.default_rng(_SEED).integers(0, 100, net.n_nodes))
+        return net
+
+    def run(net):
+        net.run(40, 60)
+        net.update_network(30, 70, 3)
+    return lambda repeat: best_time(setup, run, repeat)
+
+
+def _build(create):
+    #the network is drawn from the random module, seeded the same way for every run
+    return lambda repeat: best_time(lambda: random.seed(_SEED), lambda state: create(), repeat)
+
+
+def _generator(n_nodes, kind, *args):
+    return lambda repeat: best_time(lambda: None, lambda state: generators.generate(kind, n_nodes, *args, seed=_SEED), repeat)
+
+
+def _run_individual(engine):
+    #a random genome of phase2_evolution.py, evaluated from scratch (its compiled topology is not cached)
+    def measure(repeat):
+        module = phase2_evolution
+        with _constants(module, _ENGINE=engine, _RACING=False, _TESTS_PER_INDIVIDUAL=_BENCH_TESTS):
+            rng = np.random.default_rng(_SEED)
+            noise = NoiseBank(_BENCH_TESTS, module._ITERATIONS, module._N_NODES, -module._MAX_ENERGY_INPUT, module._MAX_ENERGY_INPUT, _SEED)
+            genome = rng.choice(genome_codec.matrix_size(module._N_NODES), module._TOTAL_CONNECTIONS, replace=False).tolist()
+            try:
+                return best_time(evaluator._topologies.clear, lambda state: module.run_individual([[genome, 0.0], noise, None]), repeat)
+            finally:
+                noise.release()
+    return measure
+
+
+def _rules_iteration(repeat):
+    #a candidate of rules_evolution.py, tested on scale-free networks of a topology bank
+    module = rules_evolution
+    with _constants(module, _TESTS_PER_INDIVIDUAL=_BENCH_TESTS):
+        noise = NoiseBank(_BENCH_TESTS, 1, module._N_NODES, 0, module._NODE_VALUES_RANGE, _SEED)
+        bank = TopologyBank(module.create_scale_free, [module._N_NODES, module._M_ZERO, module._M], _BENCH_TESTS, Seeding(_SEED))
+        try:
+            with contextlib.redirect_stdout(io.StringIO()): #iteration prints its candidate
+                return best_time(lambda: None, lambda state: module.iteration([[40, 60, 0], module.create_scale_free,
+                                 [module._N_NODES, module._M_ZERO, module._M], noise, bank]), repeat)
+        finally:
+            bank.release()
+            noise.release()
+
+
+def _evolution_step(repeat):
+    #a generation of phase2_evolution.py, evaluated by the serial backend (no fitness cached from a previous generation)
+    module = phase2_evolution
+    with tempfile.TemporaryDirectory() as directory:
+        with _constants(module, _TESTS_PER_INDIVIDUAL=_BENCH_TESTS, _RACING=False, _METRICS_FILE=os.path.join(directory, "metrics.jsonl")):
+            def setup():
+                return module.Evolution(_BENCH_POPULATION, module._N_NODES, module._TOTAL_CONNECTIONS,
+                                        evaluator=evaluator.make_evaluator("serial", module.evaluate_genome),
+                                        checkpoint_path=os.path.join(directory, "checkpoints.dat"), seeding=Seeding(_SEED))
+            return best_time(setup, lambda evolution: evolution.step(), repeat, lambda evolution: evolution.close())
+
+
+def benchmarks(sizes):
+    #(name, measure(repeat) -> seconds) of every benchmark
+    result = []
+    for n_nodes in sizes:
+        for name, create, generator in _networks(n_nodes):
+            result.append(("run/%s/%d" % (name, n_nodes), _kernel(create, False)))
+            result.append(("run_array/%s/%d" % (name, n_nodes), _kernel(create, True)))
+            result.append(("build/%s/%d" % (name, n_nodes), _build(create)))
+            result.append(("generate/%s/%d" % (name, n_nodes), _generator(n_nodes, *generator)))
+    for engine in ("object", "array", "ensemble"):
+        result.append(("run_individual/" + engine, _run_individual(engine)))
+    result.append(("rules_iteration", _rules_iteration))
+    result.append(("evolution_step", _evolution_step))
+    return result
+
+
+def machine():
+    #where the times were measured
+    return {"date": str(datetime.datetime.now()), "python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor(), "cpus": os.cpu_count()}
+
+
+def compare(results, baseline, threshold):
+    #names of the benchmarks slower than in the baseline by more than threshold (a fraction of the baseline time)
+    regressions = []
+    for name, seconds in results.items():
+        if name not in baseline:
+            continue
+        change = seconds / baseline[name] - 1 if baseline[name] > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print("%-32s %12.6f %12.6f %+8.1f%% %s" % (name, baseline[name], seconds, 100 * change, flag))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation kernels, generators and evaluators")
+    parser.add_argument("--quick", action="store_true", help="only networks of %s nodes" % " and ".join(map(str, _QUICK_SIZES)))
+    parser.add_argument("--filter", default="", help="only the benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=_REPEAT, help="runs of each benchmark, the best is kept (default: %(default)s)")
+    parser.add_argument("--save", help="save the times to this JSON file")
+    parser.add_argument("--compare", help="JSON file saved by a previous run (--save), to flag the regressions")
+    parser.add_argument("--threshold", type=float, default=_THRESHOLD, help="slowdown flagged as a regression (default: %(default)s = 20%%)")
+    args = parser.parse_args(argv[1:])
+
+    results = {}
+    for name, measure in benchmarks(_QUICK_SIZES if args.quick else _SIZES):
+        if args.filter in name:
+            results[name] = measure(args.repeat)
+            print("%-32s %12.6f s" % (name, results[name]))
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump({"machine": machine(), "repeat": args.repeat, "results": results}, baseline_file, indent=1)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print(">>>>>> compared to", args.compare, "(" + baseline["machine"]["date"] + ")")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(">>>>>>", len(regressions), "regressions:", ", ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Checkpoints of an evolution, in one append-only file.
+
+Each record holds one generation: the genomes as a packed (individuals x genes)
+uint32/uint64 matrix, their fitness, and a pickled state (the seeding of the run,
+to continue it exactly where it stopped). A record is only complete once
+its end marker is written, so a run killed while saving leaves the previous
+records usable. The matrices are aligned, to be memory-mapped when loaded.
+
+    [magic][header][state][padding][genomes][fitness][end marker]
+"""
+
+import os
+import struct
+import pickle
+import queue
+import threading
+import collections
+import numpy as np
+
+
+_MAGIC = b"PLNTCKPT"
+_END = b"CKPTEND\0"
+_HEADER = struct.Struct("<qqq8sq") #generation, individuals, genes, genomes dtype, size of the state
+_ALIGNMENT = 8
+
+Checkpoint = collections.namedtuple("Checkpoint", ["generation", "genomes", "fitness", "state", "offset", "end"])
+
+
+def _padding(position):
+    return -position % _ALIGNMENT
+
+
+def _encode(generation, genomes, fitness, state):
+    #bytes of a record
+    genomes = np.asarray(genomes)
+    dtype = np.dtype(np.uint32 if genomes.size == 0 or genomes.max() < 2**32 else np.uint64).newbyteorder("<")
+    state = pickle.dumps(state)
+    header = _MAGIC + _HEADER.pack(generation, genomes.shape[0], genomes.shape[1], dtype.str.encode(), len(state)) + state
+    genomes = genomes.astype(dtype).tobytes()
+    #every part starts aligned (records too, as their size is a multiple of the alignment)
+    return b"".join((header, b"\0" * _padding(len(header)), genomes, b"\0" * _padding(len(genomes)),
+                     np.asarray(fitness, dtype="<f8").tobytes(), _END))
+
+
+def read_checkpoints(path, mmap=True):
+    #complete records of the file, in the order they were written (the genomes and fitness are memory-mapped, unless mmap is False)
+    checkpoints = []
+    if not os.path.exists(path):
+        return checkpoints
+    size = os.path.getsize(path)
+    with open(path, "rb") as checkpoint_file:
+        offset = 0
+        while offset + len(_MAGIC) + _HEADER.size <= size:
+            checkpoint_file.seek(offset)
+            if checkpoint_file.read(len(_MAGIC)) != _MAGIC:
+                break
+            generation, individuals, genes, dtype, state_size = _HEADER.unpack(checkpoint_file.read(_HEADER.size))
+            if min(individuals, genes, state_size) < 0:
+                break
+            try:
+                dtype = np.dtype(dtype.rstrip(b"\0").decode())
+            except (TypeError, ValueError): #header of an incomplete record
+                break
+            state = checkpoint_file.read(state_size)
+            start = offset + len(_MAGIC) + _HEADER.size + state_size
+            start += _padding(start)
+            fitness_start = start + individuals * genes * dtype.itemsize
+            fitness_start += _padding(fitness_start)
+            end = fitness_start + individuals * 8
+            if end + len(_END) > size:
+                break
+            checkpoint_file.seek(end)
+            if checkpoint_file.read(len(_END)) != _END: #incomplete record
+                break
+            if mmap and individuals * genes > 0:
+                genomes = np.memmap(path, dtype, "r", start, (individuals, genes))
+                fitness = np.memmap(path, "<f8", "r", fitness_start, (individuals,))
+            else:
+                checkpoint_file.seek(start)
+                genomes = np.frombuffer(checkpoint_file.read(individuals * genes * dtype.itemsize), dtype).reshape(individuals, genes)
+                checkpoint_file.seek(fitness_start)
+                fitness = np.frombuffer(checkpoint_file.read(end - fitness_start), "<f8")
+            checkpoints.append(Checkpoint(generation, genomes, fitness, pickle.loads(state), offset, end + len(_END)))
+            offset = end + len(_END)
+    return checkpoints
+
+
+def latest_checkpoint(path, mmap=True):
+    #last complete record of the file, or None
+    checkpoints = read_checkpoints(path, mmap)
+    return checkpoints[-1] if checkpoints else None
+
+
+def generation_checkpoint(path, generation=None, mmap=True):
+    #last record of the generation (saved again after a migration, see islands.py), or the last record when generation is None;
+    #None if there is none
+    checkpoints = [checkpoint for checkpoint in read_checkpoints(path, mmap) if generation is None or checkpoint.generation == generation]
+    return checkpoints[-1] if checkpoints else None
+
+
+class CheckpointWriter:
+    """Appends checkpoints to a file from a background thread, so the evolution doesn't wait for the disk.
+        An incomplete record left at the end of the file (by a run killed while saving) is dropped when the file is opened.
+        If a checkpoint can't be written (full disk, state that can't be pickled...), the thread stops writing and the
+        error is raised by the next save() or close().
+        Parameters: path"""
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        checkpoints = read_checkpoints(path, mmap=False)
+        end = checkpoints[-1].end if checkpoints else 0
+        self.file = open(path, "r+b" if os.path.exists(path) else "wb")
+        self.file.truncate(end)
+        self.file.seek(end)
+
+        self.queue = queue.Queue()
+        self.error = None #exception of the background thread
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def save(self, generation, genomes, fitness, state=None):
+        #queue a checkpoint (the arrays are copied now, so they can change while it is written)
+        if self.error is not None:
+            raise self.error
+        self.queue.put((generation, np.array(genomes), np.array(fitness, dtype=np.float64), state))
+
+    def _write(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            try:
+                self.file.write(_encode(*record))
+                self.file.flush()
+            except Exception as error:
+                #the following records would land after a partial one: stop here (the partial record is dropped when the file is opened)
+                self.error = error
+                break
+
+    def close(self):
+        #write the queued checkpoints and close the file
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Evaluation of a population of genomes, with interchangeable backends.
+Every evaluator has map(genomes, context) -> (fitness, tests run), in the order of genomes, and close().
+For evolutions without generation barriers, submit(genome, context, tag) queues the evaluation of one genome and
+next_result() -> (tag, fitness, tests run) returns the first one done; keep slots of them submitted to keep every worker busy.
+    serial:     one genome after the other, in this process
+    thread:     a bounded pool of threads (only useful when evaluate releases the GIL, as the NumPy engines do)
+    process:    a pool of worker processes, sharing the population in shared memory
+    vectorized: batches of genomes simulated together, as one array computation, in this process
+Use make_evaluator() to create the backend chosen in the command line (see add_backend_arguments)."""
+
+import os
+import time
+import queue
+import threading
+import collections
+import math
+import numpy as np
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from shared_array import SharedArray
+from array_network import Topology
+import profiler
+
+
+_TOPOLOGY_CACHE_SIZE = 64          #compiled topologies each worker keeps, see cached_topology
+
+_topologies = collections.OrderedDict() #topologies compiled by this process
+_topologies_lock = threading.Lock() #shared by the threads of the thread backend
+
+
+def cached_topology(n_nodes, genome):
+    #Topology.from_genome, remembering the last compiled topologies of this process (a worker stays alive across generations)
+    #the cache is only read and changed under the lock; the topology is compiled outside of it, so threads compile in parallel
+    genome = np.asarray(genome, dtype=np.int64)
+    key = (n_nodes, genome.tobytes())
+    with _topologies_lock:
+        topology = _topologies.get(key)
+        if topology is not None:
+            _topologies.move_to_end(key)
+            return topology
+    topology = Topology.from_genome(n_nodes, genome)
+    with _topologies_lock:
+        _topologies[key] = topology #a thread that compiled the same genome meanwhile is replaced by an equal topology
+        _topologies.move_to_end(key)
+        while len(_topologies) > _TOPOLOGY_CACHE_SIZE:
+            _topologies.popitem(last=False)
+    return topology
+
+
+def _evaluate_chunk(task):
+    #worker side: evaluate the genomes start to stop-1 of the shared population
+    #(with the profiler enabled, the profile of the chunk and the time it was done are sent back too)
+    evaluate, genomes, start, stop, context = task
+    fitness = np.zeros(stop - start)
+    tests = np.zeros(stop - start, dtype=np.int64)
+    for i in range(start, stop):
+        fitness[i - start], tests[i - start] = evaluate(genomes[i].astype(np.int64), context)
+    if isinstance(genomes, SharedArray):
+        genomes.release()
+    return start, fitness, tests, profiler.take(), time.time()
+
+
+def _evaluate_one(task):
+    #worker side of submit: evaluate one genome (the profile and done time are sent back as by _evaluate_chunk)
+    evaluate, genome, context, tag = task
+    fitness, tests = evaluate(np.asarray(genome, dtype=np.int64), context)
+    return tag, fitness, tests, profiler.take(), time.time()
+
+
+def _merge_profile(profile, done):
+    #add the profile of a worker to the profile of this thread, and the time its results took to get here
+    if profile is not None:
+        profiler.merge(profile)
+        profiler.add_time("ipc", time.time() - done)
+
+
+def _map_chunks(pool, evaluate, genomes, context, workers, min_chunk):
+    #evaluate the genomes in chunks (see chunk_sizes), dispatched to whichever worker of the pool is free
+    fitness = np.zeros(len(genomes))
+    tests = np.zeros(len(genomes), dtype=np.int64)
+    tasks = []
+    start = 0
+    for size in chunk_sizes(len(genomes), workers, min_chunk):
+        tasks.append((evaluate, genomes, start, start + size, context))
+        start += size
+    for start, chunk_fitness, chunk_tests, profile, done in pool.imap_unordered(_evaluate_chunk, tasks):
+        fitness[start:start + len(chunk_fitness)] = chunk_fitness
+        tests[start:start + len(chunk_tests)] = chunk_tests
+        _merge_profile(profile, done) #ipc: from the end of the chunk to its results being here
+    return fitness, tests
+
+
+class _AsyncPool:
+    #submit and next_result of the pool evaluators: each genome is a task of its own, whose result is queued as soon as it is done
+    def _start_async(self):
+        self.slots = self.workers #evaluations submitted at once to keep every worker busy
+        self.running = 0 #submitted evaluations whose result wasn't returned yet
+        self.done = queue.Queue()
+
+    def submit(self, genome, context=None, tag=None):
+        #queue the evaluation of genome; its result is returned by next_result, with tag
+        self.running += 1
+        self.pool.apply_async(_evaluate_one, ((self.evaluate, np.asarray(genome), context, tag),),
+                              callback=self.done.put, error_callback=self.done.put)
+
+    def next_result(self):
+        #tag, fitness and amount of tests of the first submitted evaluation done (waits for one if none is)
+        result = self.done.get()
+        self.running -= 1
+        if isinstance(result, BaseException):
+            raise result
+        tag, fitness, tests, profile, done = result
+        _merge_profile(profile, done)
+        return tag, fitness, tests
+
+
+def chunk_sizes(n_tasks, workers, min_chunk=1):
+    #guided scheduling: big chunks first, smaller and smaller ones at the end, so workers finish together
+    sizes = []
+    remaining = n_tasks
+    while remaining > 0:
+        size = min(remaining, max(min_chunk, math.ceil(remaining / (2.0 * workers))))
+        sizes.append(size)
+        remaining -= size
+    return sizes
+
+
+class ProcessPoolEvaluator(_AsyncPool):
+    """Evaluates populations in a pool of worker processes, kept alive across generations.
+        The genomes are packed in a shared memory matrix, the workers receive only index ranges of it (dispatched
+        one chunk at a time to whichever worker is free) and send back only the fitness of each genome.
+        evaluate(genome, context) must be a module level function returning (fitness, tests run).
+        Parameters: evaluate, workers (None: one per cpu), min_chunk"""
+    def __init__(self, evaluate, workers=None, min_chunk=1):
+        self.evaluate = evaluate
+        self.workers = workers or os.cpu_count()
+        self.pool = Pool(self.workers)
+        self.min_chunk = min_chunk
+        self._start_async()
+
+    def map(self, genomes, context=None):
+        #fitness and amount of tests of each genome (in the same order)
+        if len(genomes) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+        genomes = np.asarray(genomes)
+        dtype = np.uint32 if genomes.max() < 2**32 else np.uint64
+        with profiler.phase("ipc"):
+            shared = SharedArray(genomes.shape, dtype)
+            shared[:] = genomes
+
+        fitness, tests = _map_chunks(self.pool, self.evaluate, shared, context, self.workers, self.min_chunk)
+
+        shared.release()
+        return fitness, tests
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class SerialEvaluator:
+    """Evaluates populations one genome after the other, in this process
+        Parameters: evaluate (see ProcessPoolEvaluator)"""
+    def __init__(self, evaluate):
+        self.evaluate = evaluate
+        self.workers = 1
+        self.slots = 1
+        self.waiting = collections.deque() #submitted evaluations, run by next_result
+        self.running = 0
+
+    def map(self, genomes, context=None):
+        if len(genomes) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        start, fitness, tests, profile, done = _evaluate_chunk((self.evaluate, np.asarray(genomes), 0, len(genomes), context))
+        profiler.merge(profile)
+        return fitness, tests
+
+    def submit(self, genome, context=None, tag=None):
+        self.waiting.append((self.evaluate, genome, context, tag))
+        self.running += 1
+
+    def next_result(self):
+        tag, fitness, tests, profile, done = _evaluate_one(self.waiting.popleft())
+        self.running -= 1
+        profiler.merge(profile)
+        return tag, fitness, tests
+
+    def close(self):
+        pass
+
+
+class ThreadPoolEvaluator(_AsyncPool):
+    """Evaluates populations in a fixed pool of threads, kept alive across generations.
+        The threads share the population and the context with no copies, but only run in parallel while evaluate
+        releases the GIL (the array and ensemble engines spend most of their time in NumPy).
+        Parameters: evaluate (see ProcessPoolEvaluator), workers (None: one per cpu), min_chunk"""
+    def __init__(self, evaluate, workers=None, min_chunk=1):
+        self.evaluate = evaluate
+        self.workers = workers or os.cpu_count()
+        self.pool = ThreadPool(self.workers)
+        self.min_chunk = min_chunk
+        self._start_async()
+
+    def map(self, genomes, context=None):
+        if len(genomes) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        return _map_chunks(self.pool, self.evaluate, np.asarray(genomes), context, self.workers, self.min_chunk)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+
+class VectorizedEvaluator:
+    """Evaluates populations in batches of batch_size genomes, each batch simulated at once, in this process.
+        evaluate_batch(genomes, context) must return the fitness and the amount of tests run of each genome of
+        the batch (as arrays, in the same order).
+        submit only queues the genome: next_result simulates the next submitted genomes at once, up to batch_size of them
+        and only as long as they were submitted with the same context (the same object), so each is simulated with its own.
+        Parameters: evaluate_batch, batch_size"""
+    def __init__(self, evaluate_batch, batch_size=4):
+        self.evaluate_batch = evaluate_batch
+        self.batch_size = batch_size
+        self.workers = 1
+        self.slots = batch_size
+        self.waiting = collections.deque() #submitted (genome, context, tag), not simulated yet
+        self.results = collections.deque() #results of the last batch, not returned yet
+        self.running = 0
+
+    def map(self, genomes, context=None):
+        genomes = np.asarray(genomes)
+        fitness = np.zeros(len(genomes))
+        tests = np.zeros(len(genomes), dtype=np.int64)
+        for start in range(0, len(genomes), self.batch_size):
+            stop = min(start + self.batch_size, len(genomes))
+            fitness[start:stop], tests[start:stop] = self.evaluate_batch(genomes[start:stop].astype(np.int64), context)
+        return fitness, tests
+
+    def submit(self, genome, context=None, tag=None):
+        self.waiting.append((genome, context, tag))
+        self.running += 1
+
+    def next_result(self):
+        if not self.results:
+            batch = [self.waiting.popleft()]
+            while self.waiting and len(batch) < self.batch_size and self.waiting[0][1] is batch[0][1]:
+                batch.append(self.waiting.popleft())
+            fitness, tests = self.evaluate_batch(np.asarray([genome for genome, context, tag in batch], dtype=np.int64), batch[0][1])
+            self.results.extend(zip([tag for genome, context, tag in batch], fitness.tolist(), tests.tolist()))
+        self.running -= 1
+        return self.results.popleft()
+
+    def close(self):
+        pass
+
+
+BACKENDS = ("serial", "thread", "process", "vectorized")
+
+
+def make_evaluator(backend, evaluate, evaluate_batch=None, workers=None, batch_size=4):
+    #evaluator of one of the BACKENDS; evaluate_batch is only needed by the vectorized one
+    if backend == "serial":
+        return SerialEvaluator(evaluate)
+    if backend == "thread":
+        return ThreadPoolEvaluator(evaluate, workers)
+    if backend == "process":
+        return ProcessPoolEvaluator(evaluate, workers)
+    if backend == "vectorized":
+        if evaluate_batch is None:
+            raise ValueError("the vectorized backend needs an evaluate_batch function")
+        return VectorizedEvaluator(evaluate_batch, batch_size)
+    raise ValueError("unknown backend: " + str(backend))
+
+
+def add_backend_arguments(parser, default="process"):
+    #command line options of make_evaluator
+    parser.add_argument("--backend", choices=BACKENDS, default=default, help="how the population is evaluated (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=None, help="threads or processes of the thread/process backends (default: one per cpu)")
+    parser.add_argument("--batch-size", type=int, default=4, help="genomes simulated together by the vectorized backend (default: %(default)s)")
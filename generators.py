@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Fast generators of the network topologies of network.py.
+
+Each generator returns the connections as two arrays (src, dst): every
+undirected edge once, without self connections or repeated edges. They use a
+seeded NumPy generator (seed: an int, a np.random.Generator or None) instead of
+the random module, and work on whole arrays, so they handle millions of nodes.
+The graphs follow the same construction rules as the classes of network.py,
+but, being drawn differently, not the same graphs for a given random state.
+
+GlobalNetwork has no explicit connections (every node is connected to every
+node): global_edges returns no edges, and the topology is flagged as
+fully_connected (see FULLY_CONNECTED).
+
+to_network() populates a Network (or a GlobalNetwork) with the edges, and
+to_topology() compiles them into an array_network.Topology directly.
+"""
+
+import numpy as np
+from network import Network, GlobalNetwork
+from array_network import Topology
+
+
+def _unique_edges(src, dst, n_nodes):
+    #each undirected edge once (as (lower, higher) node), in the order of its first occurrence, without self connections
+    src = np.asarray(src, dtype=np.int64)
+    dst = np.asarray(dst, dtype=np.int64)
+    keep = src != dst
+    low = np.minimum(src[keep], dst[keep])
+    high = np.maximum(src[keep], dst[keep])
+    keys, first = np.unique(low * n_nodes + high, return_index=True)
+    first.sort()
+    return low[first], high[first]
+
+
+def local_edges(n_nodes, n_connections, seed=None):
+    #ring where each node is connected to its n_connections closest neighbours (see Node.connect_to_neighbours)
+    nodes = np.arange(n_nodes)
+    offsets = np.arange(n_connections + 1) - n_connections/2
+    targets = ((nodes[:, None] + offsets[None, :]) % n_nodes).astype(np.int64)
+    return _unique_edges(np.repeat(nodes, len(offsets)), targets.ravel(), n_nodes)
+
+
+def small_world_edges(n_nodes, n_connections, p, seed=None):
+    #local network where each edge is rewired with probability p: its far end moves to a random node,
+    #avoiding self connections and existing edges (Watts-Strogatz; SmallWorldNetwork considers each edge from both ends)
+    rng = np.random.default_rng(seed)
+    src, dst = local_edges(n_nodes, n_connections)
+    dst = dst.copy()
+    rewire = np.flatnonzero(rng.random(len(src)) < p)
+    kept = np.setdiff1d(np.arange(len(src)), rewire)
+    kept_keys = np.minimum(src[kept], dst[kept]) * n_nodes + np.maximum(src[kept], dst[kept])
+
+    pending = rewire
+    while len(pending):
+        dst[pending] = rng.integers(0, n_nodes, len(pending))
+        keys = np.minimum(src[rewire], dst[rewire]) * n_nodes + np.maximum(src[rewire], dst[rewire])
+        #draw again the rewired edges that are self connections, already exist, or repeat an earlier rewired edge
+        bad = (src[rewire] == dst[rewire]) | np.isin(keys, kept_keys)
+        unique_first = np.zeros(len(rewire), dtype=bool)
+        unique_first[np.unique(keys, return_index=True)[1]] = True
+        bad |= ~unique_first
+        pending = rewire[bad]
+    return src, dst
+
+
+def random_edges(n_nodes, n_edges, seed=None):
+    #n_edges distinct connections between random pairs of nodes
+    if n_edges > n_nodes * (n_nodes - 1) // 2:
+        raise ValueError("too many edges for " + str(n_nodes) + " nodes")
+    rng = np.random.default_rng(seed)
+    src = np.zeros(0, dtype=np.int64)
+    dst = np.zeros(0, dtype=np.int64)
+    while len(src) < n_edges:
+        missing = n_edges - len(src)
+        draw = rng.integers(0, n_nodes, (2, missing + missing//10 + 16)) #a few more, to make up for the rejected ones
+        src, dst = _unique_edges(np.concatenate((src, draw[0])), np.concatenate((dst, draw[1])), n_nodes)
+    return src[:n_edges], dst[:n_edges]
+
+
+def global_edges(n_nodes, seed=None):
+    #every node is connected to every node: the connections are implicit (see GlobalNetwork)
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+
+def von_neumann_edges(n_nodes, grid_lines, grid_columns, seed=None):
+    #circular grid, each node connected to its left, right, up and down neighbours (see VonNeumannNetwork)
+    size = grid_lines * grid_columns
+    pos = np.arange(size)
+    column = pos % grid_columns
+    right = np.where(column != grid_columns - 1, pos + 1, pos - grid_columns + 1)
+    down = (pos + grid_columns) % size
+    return _unique_edges(np.concatenate((pos, pos)), np.concatenate((right, down)), n_nodes)
+
+
+def scale_free_edges(n_nodes, m_zero, m, seed=None):
+    #preferential attachment (see ScaleFreeNetwork): m_zero nodes fully connected, then each new node connects to m
+    #distinct nodes, drawn with probability proportional to their degree
+    if m > m_zero:
+        raise ValueError("m must be at most m_zero")
+    rng = np.random.default_rng(seed)
+    n_new = max(n_nodes - m_zero, 0)
+    first, second = np.triu_indices(m_zero, 1)
+
+    #roulette: each node appears once per connection it has; the first draw of each new node only sees the
+    #connections made before it
+    size = m_zero * (m_zero - 1)
+    roulette = np.repeat(np.arange(m_zero), m_zero - 1).tolist() + [0] * (2 * m * n_new)
+    targets = np.empty((n_new, m), dtype=np.int64)
+    draws = rng.random(4 * m * n_new + 16).tolist() #uniform draws, consumed in order
+    d = 0
+    for i in range(n_new):
+        selection = []
+        while len(selection) < m:
+            if d == len(draws):
+                draws = rng.random(4 * m * n_new + 16).tolist()
+                d = 0
+            result = roulette[int(draws[d] * size)]
+            d += 1
+            if result not in selection: #don't get repeated connections
+                selection.append(result)
+        targets[i] = selection
+        new_node_id = m_zero + i
+        for result in selection:
+            roulette[size] = result
+            roulette[size + 1] = new_node_id
+            size += 2
+
+    new_nodes = np.repeat(np.arange(m_zero, m_zero + n_new), m)
+    return (np.concatenate((first, new_nodes)).astype(np.int64), np.concatenate((second, targets.ravel())).astype(np.int64))
+
+
+GENERATORS = {
+    "local": local_edges,
+    "small_world": small_world_edges,
+    "random": random_edges,
+    "global": global_edges,
+    "von_neumann": von_neumann_edges,
+    "scale_free": scale_free_edges,
+}
+
+FULLY_CONNECTED = {"global"} #topologies whose connections are implicit
+
+
+def generate(kind, n_nodes, *args, seed=None):
+    #edges (src, dst) of a topology of GENERATORS; args are the parameters of its class in network.py, after n_nodes
+    return GENERATORS[kind](n_nodes, *args, seed=seed)
+
+
+def to_network(kind, n_nodes, *args, seed=None):
+    #Network with a generated topology (a GlobalNetwork for "global")
+    if kind in FULLY_CONNECTED:
+        return GlobalNetwork(n_nodes)
+    network = Network(n_nodes)
+    network.initialize_from_edges(*generate(kind, n_nodes, *args, seed=seed))
+    return network
+
+
+def to_topology(kind, n_nodes, *args, seed=None):
+    #compiled Topology of a generated network, with the same connections as to_network
+    src, dst = generate(kind, n_nodes, *args, seed=seed)
+    #both directions, interleaved as in initialize_from_edges
+    return Topology.from_edges(n_nodes, np.column_stack((src, dst)).ravel(), np.column_stack((dst, src)).ravel(), kind in FULLY_CONNECTED)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Genetic operators applied to a whole generation at once.
+
+The population is a (individuals x genome_size) int64 matrix of genomes (see
+genome_codec.py): every row holds distinct positions. Each operator works on
+all the individuals together, with a NumPy random generator (rng).
+"""
+
+import numpy as np
+import genome_codec
+
+
+def tournament(fitness, n_parents, sample_size, rng):
+    #index of n_parents parents: each one is the fittest of a random sample (without repetition) of sample_size individuals
+    fitness = np.asarray(fitness)
+    sample_size = min(sample_size, len(fitness))
+    samples = np.argpartition(rng.random((n_parents, len(fitness))), sample_size - 1, axis=1)[:, :sample_size]
+    return samples[np.arange(n_parents), np.argmax(fitness[samples], axis=1)]
+
+
+def crossover(fathers, mothers, genome_size, rng):
+    #each child is a random sample of genome_size genes from the genes of its parents, without repetition
+    #(fathers[i] and mothers[i] are the parents of the child i); the genes of each child are sorted
+    bags = np.sort(np.concatenate((fathers, mothers), axis=1), axis=1)
+    #random keys over the union of the genes: a gene present in both parents only takes part once
+    keys = rng.random(bags.shape)
+    keys[:, 1:][bags[:, 1:] == bags[:, :-1]] = np.inf
+    chosen = np.argpartition(keys, genome_size - 1, axis=1)[:, :genome_size]
+    return np.sort(np.take_along_axis(bags, chosen, axis=1), axis=1)
+
+
+def mutate(children, mutation_rate, n_nodes, rng, keep_node=True):
+    #each gene is replaced by a new one with chance mutation_rate; the genes of a child stay distinct
+    #keep_node: the new edge keeps one node of the old one, and the other end moves to a random node
+    #           (so the kept node keeps its number of connections); otherwise, it is any edge of the matrix
+    children = np.array(children, dtype=np.int64)
+    mutated = rng.random(children.shape) < mutation_rate
+    for child, genes in zip(children, mutated):
+        positions = np.flatnonzero(genes)
+        if len(positions) == 0:
+            continue
+        kept = np.sort(child[~genes])
+        old_genes = child[positions]
+        new_genes = np.empty(len(positions), dtype=np.int64)
+        pending = np.arange(len(positions))
+        while len(pending):
+            new_genes[pending] = _draw_genes(old_genes[pending], n_nodes, rng, keep_node)
+            #draw again the genes already in the child, or drawn twice
+            found = np.searchsorted(kept, new_genes)
+            repeated = kept[np.minimum(found, len(kept) - 1)] == new_genes if len(kept) else np.zeros(len(new_genes), dtype=bool)
+            first = np.zeros(len(new_genes), dtype=bool)
+            first[np.unique(new_genes, return_index=True)[1]] = True
+            pending = np.flatnonzero(repeated | ~first)
+        child[positions] = new_genes
+    return children
+
+
+def _draw_genes(old_genes, n_nodes, rng, keep_node):
+    #new random genes in place of old_genes (see mutate)
+    if not keep_node:
+        return rng.integers(0, genome_codec.matrix_size(n_nodes), len(old_genes))
+    line, column = genome_codec.decode(old_genes)
+    node = line #the node that keeps the edge
+    other = rng.integers(0, n_nodes - 1, len(old_genes))
+    other += other >= node #any node, but the kept one
+    return genome_codec.encode(np.maximum(node, other), np.minimum(node, other))
+
+
+def unique_rows(population):
+    #whether each genome has only distinct genes
+    population = np.sort(np.asarray(population), axis=1)
+    return ~(population[:, 1:] == population[:, :-1]).any(axis=1)
+
+
+def breed(population, fitness, n_children, sample_size, mutation_rate, n_nodes, rng, keep_node=True):
+    #a new generation of n_children: parents chosen by tournament, crossover and mutation
+    population = np.asarray(population, dtype=np.int64)
+    fathers = tournament(fitness, n_children, sample_size, rng)
+    mothers = tournament(fitness, n_children, sample_size, rng)
+    children = crossover(population[fathers], population[mothers], population.shape[1], rng)
+    return mutate(children, mutation_rate, n_nodes, rng, keep_node)
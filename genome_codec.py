@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Genome <-> edges conversion.
+
+A genome is an array of positions in the triangular part of the connections
+matrix below the main diagonal, stored line by line: position
+line*(line-1)/2 + column is the edge (line, column), with column < line.
+Positions and nodes are 64-bit integers, and the square roots are exact
+integer ones, so the conversion stays exact for any network that fits in
+memory (float square roots start to round positions above 2**52).
+"""
+
+import math
+import numpy as np
+
+
+def matrix_size(n_nodes):
+    #amount of possible edges (size of the triangular region below the main diagonal of the matrix)
+    return n_nodes * (n_nodes - 1) // 2
+
+
+def encode(line, column):
+    #positions of the edges (line, column), column < line (arrays, or single numbers)
+    if np.isscalar(line) and np.isscalar(column):
+        return int(line) * (int(line) - 1) // 2 + int(column)
+    line = np.asarray(line, dtype=np.int64)
+    return line * (line - 1) // 2 + np.asarray(column, dtype=np.int64)
+
+
+def decode(genome):
+    #edges (line, column) of the positions in the genome, as two int64 arrays
+    genome = np.asarray(genome, dtype=np.int64)
+    #float estimate, then corrected to the exact line: the largest with line*(line-1)/2 <= position
+    line = ((1 + np.sqrt(1 + 8*genome.astype(np.float64))) / 2.0).astype(np.int64)
+    for _ in range(2):
+        line -= (line * (line - 1)) // 2 > genome
+        line += ((line + 1) * line) // 2 <= genome
+    return line, genome - (line * (line - 1)) // 2
+
+
+def decode_gene(position):
+    #edge (line, column) of a single position
+    position = int(position)
+    line = (1 + math.isqrt(1 + 8*position)) // 2
+    return line, position - line * (line - 1) // 2
+
+
+def canonical_key(genome):
+    #hashable key of the network of a genome: the order of the genes doesn't change the network
+    return tuple(sorted(np.asarray(genome, dtype=np.int64).tolist()))
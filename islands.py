@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Island model of phase2_evolution.py: several populations evolving in their own processes (or hosts), that send
+their best genomes to their neighbours every few generations.
+
+    python islands.py --islands 4 --topology ring --interval 5 --migrants 2
+    python islands.py --islands 4 --transport tcp --port 5600
+    python islands.py --island 1 --hosts host0:5600,host1:5600,host2:5600,host3:5600    (one island per host)
+
+Each island is an Evolution, with its own checkpoint and metrics files (islands_<n>.dat/.jsonl) and its own
+streams of the master seed (see seeding.py). After the generations whose number is a multiple of --interval, an
+island sends its --migrants best genomes to its neighbours (the next island of the ring, or every other island), then
+waits for the migrants of the same generation from the islands it receives from; they replace its least fit
+individuals (see Evolution.immigrate). The migrants go through multiprocessing queues (one per island, islands of
+this machine) or TCP connections (pickled messages: only between trusted hosts).
+
+--resume continues every island from the last complete record of its own checkpoint file. The islands may have
+stopped at different generations: an island only waits for a neighbour that is behind it (up to _MIGRATION_TIMEOUT
+seconds), and takes the newest migrants it got from a neighbour that is ahead.
+"""
+
+import os
+import sys
+import time
+import queue
+import pickle
+import socket
+import struct
+import argparse
+import threading
+import multiprocessing
+
+import profiler
+from profiler import add_profile_argument
+from evaluator import make_evaluator, add_backend_arguments
+from checkpoint import latest_checkpoint
+from seeding import Seeding, add_seed_argument
+import phase2_evolution
+from phase2_evolution import Evolution, evaluate_genome, evaluate_genomes, add_racing_arguments, racing_arguments
+
+
+_ISLANDS = 4                      #populations evolving side by side
+_TOPOLOGY = "ring"                #who receives the migrants of an island: "ring" (the next island) or "full" (every other island)
+_MIGRATION_INTERVAL = 5           #generations between two migrations
+_MIGRANTS = 2                     #best genomes sent by an island at each migration
+_MIGRATION_TIMEOUT = 600          #seconds an island waits for the migrants of a neighbour, before going on without them
+_CONNECT_TIMEOUT = 60             #seconds a TCP island tries to connect to a neighbour that isn't listening yet
+_PORT = 5600                      #TCP port of the first island of this machine (the island n listens on _PORT + n)
+_CHECKPOINT_FILE = "execution/islands.dat" #island n: execution/islands_n.dat
+_METRICS_FILE = "logs/islands.jsonl"       #island n: logs/islands_n.jsonl
+
+TOPOLOGIES = ("ring", "full")
+TRANSPORTS = ("queue", "tcp")
+
+
+def island_path(path, index):
+    #file of the island index (path with _index before its extension)
+    root, extension = os.path.splitext(path)
+    return "%s_%d%s" % (root, index, extension)
+
+
+def neighbours(index, n_islands, topology):
+    #islands that receive the migrants of the island index
+    if topology == "ring":
+        return [(index + 1) % n_islands] if n_islands > 1 else []
+    if topology == "full":
+        return [j for j in range(n_islands) if j != index]
+    raise ValueError("unknown topology: " + str(topology))
+
+
+class QueueTransport:
+    """Migrants between processes of this machine: each island reads its own multiprocessing queue
+        Parameters: index, queues (one per island, created before the processes are started)"""
+    def __init__(self, index, queues):
+        self.index = index
+        self.queues = queues
+
+    def send(self, island, message):
+        self.queues[island].put(message)
+
+    def receive(self, timeout):
+        #next message for this island, or None after timeout seconds
+        try:
+            return self.queues[self.index].get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+def _receive_exactly(connection, size):
+    #size bytes of the connection, or None when it is closed
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+class SocketTransport:
+    """Migrants over TCP: each island listens on its address and connects to the addresses of its neighbours
+        (on the first message, retrying for _CONNECT_TIMEOUT seconds while they start). The messages are pickled, with
+        their size in front.
+        Parameters: index, addresses ((host, port) of every island)"""
+    def __init__(self, index, addresses):
+        self.index = index
+        self.addresses = addresses
+        self.inbox = queue.Queue()
+        self.connections = {}
+        self.server = socket.create_server(addresses[index])
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self.server.accept()
+            except OSError: #closed
+                break
+            threading.Thread(target=self._read, args=(connection,), daemon=True).start()
+
+    def _read(self, connection):
+        with connection:
+            while True:
+                header = _receive_exactly(connection, 8)
+                if header is None:
+                    break
+                data = _receive_exactly(connection, struct.unpack("<Q", header)[0])
+                if data is None:
+                    break
+                self.inbox.put(pickle.loads(data))
+
+    def _connect(self, island):
+        deadline = time.monotonic() + _CONNECT_TIMEOUT
+        while True:
+            try:
+                connection = socket.create_connection(self.addresses[island], timeout=_CONNECT_TIMEOUT)
+                connection.settimeout(None)
+                return connection
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def send(self, island, message):
+        if island not in self.connections:
+            self.connections[island] = self._connect(island)
+        data = pickle.dumps(message)
+        self.connections[island].sendall(struct.pack("<Q", len(data)) + data)
+
+    def receive(self, timeout):
+        try:
+            return self.inbox.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.server.close()
+
+
+def make_transport(index, kind, where):
+    #transport of the island index: kind "queue" (where: the queues of every island) or "tcp" (where: the addresses of every island)
+    if kind == "queue":
+        return QueueTransport(index, where)
+    if kind == "tcp":
+        return SocketTransport(index, where)
+    raise ValueError("unknown transport: " + str(kind))
+
+
+class Migration:
+    """Exchange of the best genomes of the island index with the islands of its topology, every interval generations
+        Parameters: index, n_islands, topology, transport, interval, migrants"""
+    def __init__(self, index, n_islands, topology, transport, interval=_MIGRATION_INTERVAL, migrants=_MIGRANTS):
+        self.index = index
+        self.destinations = neighbours(index, n_islands, topology)
+        self.sources = [j for j in range(n_islands) if index in neighbours(j, n_islands, topology)]
+        self.transport = transport
+        self.interval = interval
+        self.migrants = migrants
+        self.received = {source: {} for source in self.sources} #source -> generation -> its migrants, not used yet
+
+    def due(self, generation):
+        return self.interval > 0 and (generation + 1) % self.interval == 0
+
+    def exchange(self, generation, individuals):
+        #send the best of the evaluated individuals, and return the migrants (genome, fitness) of the same generation of the
+        #sources (or the newest ones received, from a source that is ahead, or that didn't send them in time)
+        best = sorted(individuals, key = lambda x: x[1])[-self.migrants:] if self.migrants > 0 else []
+        message = (self.index, generation, [individual[0] for individual in best], [individual[1] for individual in best])
+        for destination in self.destinations:
+            self.transport.send(destination, message)
+
+        deadline = time.monotonic() + _MIGRATION_TIMEOUT
+        while any(max(self.received[source], default=-1) < generation for source in self.sources):
+            message = self.transport.receive(max(deadline - time.monotonic(), 0))
+            if message is None:
+                print("island", self.index, ": no migrants in time, generation", generation)
+                break
+            source, sent, genomes, fitness = message
+            self.received[source][sent] = list(zip(genomes, fitness))
+
+        migrants = []
+        for source in self.sources:
+            arrived = [sent for sent in self.received[source] if sent <= generation]
+            if arrived:
+                migrants += self.received[source][max(arrived)]
+            for sent in arrived:
+                del self.received[source][sent]
+        return migrants
+
+
+def run_island(index, n_islands, kind, where, args, racing=None):
+    #evolution of the island index (in its own process), exchanging migrants through the transport kind (see make_transport)
+    profiler.enable(args.profile)
+    transport = make_transport(index, kind, where)
+    evaluator = make_evaluator(args.backend, evaluate_genome, evaluate_genomes, args.workers, args.batch_size)
+    evolution = Evolution(phase2_evolution._POPULATION_SIZE, phase2_evolution._N_NODES, phase2_evolution._TOTAL_CONNECTIONS,
+                          evaluator=evaluator, checkpoint_path=island_path(args.checkpoint, index), resume=args.resume,
+                          seeding=Seeding(args.seed).child("island", index), metrics_path=island_path(args.metrics, index),
+                          racing=racing)
+    migration = Migration(index, n_islands, args.topology, transport, args.interval, args.migrants)
+    try:
+        for i in range(evolution.generation, phase2_evolution._GENERATIONS):
+            print(">>>>>>ISLAND", index, "GENERATION", i)
+            evolution.step()
+            if migration.due(i):
+                with evolution.timer.phase("migration"):
+                    arrivals = evolution.immigrate(migration.exchange(i, evolution.individuals))
+                print("island", index, ":", arrivals, "migrants")
+            evolution.print_results()
+            evolution.evolute()
+    finally:
+        evolution.close()
+        transport.close()
+    if profiler.enabled():
+        print(">>>>>>PROFILE OF ISLAND", index)
+        print(profiler.summary(evolution.profile))
+
+
+def _address(text):
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Island model of the evolution of the network topology")
+    parser.add_argument("--islands", type=int, default=_ISLANDS, help="populations (default: %(default)s)")
+    parser.add_argument("--topology", choices=TOPOLOGIES, default=_TOPOLOGY, help="where the migrants go (default: %(default)s)")
+    parser.add_argument("--interval", type=int, default=_MIGRATION_INTERVAL, help="generations between migrations (default: %(default)s)")
+    parser.add_argument("--migrants", type=int, default=_MIGRANTS, help="best genomes sent by each island (default: %(default)s)")
+    parser.add_argument("--transport", choices=TRANSPORTS, default="queue", help="how the migrants travel between the islands of this machine (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=_PORT, help="TCP port of the first island, with --transport tcp (default: %(default)s)")
+    parser.add_argument("--island", type=int, default=None, help="only run this island, over TCP with the islands of --hosts")
+    parser.add_argument("--hosts", default=None, help="host:port of every island, separated by commas (with --island)")
+    parser.add_argument("--resume", action="store_true", help="continue each island from the last complete record of its checkpoint file")
+    parser.add_argument("--checkpoint", default=_CHECKPOINT_FILE, help="checkpoint files, numbered by island (default: %(default)s)")
+    parser.add_argument("--metrics", default=_METRICS_FILE, help="metrics files, numbered by island (default: %(default)s)")
+    add_racing_arguments(parser)
+    add_backend_arguments(parser, default="serial") #each island is a process already
+    add_profile_argument(parser)
+    add_seed_argument(parser)
+    args = parser.parse_args(argv[1:])
+    racing = racing_arguments(parser, args)
+
+    if args.island is not None:
+        #one island of a run over several hosts: every island must be given the same --hosts and --seed
+        if args.hosts is None or args.seed is None:
+            parser.error("--island needs --hosts and --seed")
+        addresses = [_address(text) for text in args.hosts.split(",")]
+        run_island(args.island, len(addresses), "tcp", addresses, args, racing)
+        return 0
+
+    args.seed = Seeding(args.seed).seed #the same master seed for every island (each one derives its own streams from it)
+    print("seed:", args.seed)
+    if args.transport == "queue":
+        where = [multiprocessing.Queue() for i in range(args.islands)]
+    else:
+        where = [("127.0.0.1", args.port + index) for index in range(args.islands)]
+    #not daemons: an island can have its own pool of workers (--backend process)
+    processes = [multiprocessing.Process(target=run_island, args=(index, args.islands, args.transport, where, args, racing)) for index in range(args.islands)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    print(">>>>>>FINAL RESULT (%.3f s):" % (time.perf_counter() - start))
+    best = None
+    for index in range(args.islands):
+        checkpoint = latest_checkpoint(island_path(args.checkpoint, index), mmap=False)
+        if checkpoint is not None:
+            print("island", index, ": generation", checkpoint.generation, "best =", checkpoint.fitness.max())
+            if best is None or checkpoint.fitness.max() > best.fitness.max():
+                best = checkpoint
+    if best is not None:
+        print(best.genomes[best.fitness.argmax()].tolist())
+    return 1 if any(process.exitcode != 0 for process in processes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Metrics of the evolution runs, as one JSON line per generation.
+
+MetricsWriter keeps the records in memory and appends them to the file in
+blocks, instead of reopening the file for every line. Each record is a flat
+dict (fitness summary, diversity, evaluations, ...) plus the wall time of the
+phases of the generation, measured by a PhaseTimer. The genomes are not part
+of the records: they are saved by checkpoint.py.
+
+The first line of each run holds its start time and parameters; a run can be
+read back with read_metrics().
+"""
+
+import os
+import json
+import time
+import datetime
+import contextlib
+import numpy as np
+
+
+def fitness_summary(fitness):
+    #best, avg, median and worst of a list of fitness
+    fitness = np.asarray(fitness, dtype=np.float64)
+    return {"best": float(fitness.max()), "avg": float(fitness.mean()), "median": float(np.median(fitness)), "worst": float(fitness.min())}
+
+
+def diversity(genomes):
+    #distinct genes of the population over its amount of genes: 1/individuals when every genome is the same, 1 when no gene is shared
+    genomes = np.asarray(genomes)
+    if genomes.size == 0:
+        return 0.0
+    return len(np.unique(genomes)) / float(genomes.size)
+
+
+class PhaseTimer:
+    """Wall time spent in each phase of a generation (e.g. with timer.phase("evaluate"): ...).
+        The time of a phase entered several times is summed, until the times are taken by reset()."""
+    def __init__(self):
+        self.times = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+
+    def reset(self):
+        #times measured since the last reset
+        times, self.times = self.times, {}
+        return times
+
+
+class MetricsWriter:
+    """Appends records (dicts) to a JSON lines file, buffer_size records at a time.
+        The records still in memory are written by flush() and close().
+        Parameters: path, run (parameters of the run, written in its first line), buffer_size"""
+    def __init__(self, path, run=None, buffer_size=10):
+        self.path = path
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.start = time.perf_counter()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.write(dict(run or {}, start=str(datetime.datetime.now())))
+        self.flush()
+
+    def write(self, record):
+        #queue a record, with the seconds since the start of the run
+        self.buffer.append(json.dumps(dict(record, elapsed=round(time.perf_counter() - self.start, 6)), separators=(",", ":")))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            with open(self.path, "a") as metrics_file:
+                metrics_file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+
+    def close(self):
+        self.flush()
+
+
+def read_metrics(path):
+    #records of a metrics file, one list per run (the first record of each list is its start line)
+    runs = []
+    with open(path) as metrics_file:
+        for line in metrics_file:
+            record = json.loads(line)
+            if "start" in record:
+                runs.append([])
+            if runs:
+                runs[-1].append(record)
+    return runs
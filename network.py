@@ -4,6 +4,7 @@
 import random
 import datetime
 import math
+import genome_codec
 
 
 #constants 
@@ -19,13 +20,11 @@ _UPPER_ENERGY_LIMIT_DANGER = 70     #absolute upper limit. If the node stay abov
 _GENERATIONS_IN_DANGER_LIMIT = 3    #maximum # of generations the node can stay in danger level
 _MAX_ENERGY_INPUT = 10              #maximum amount of energy inputed to the system 
 
-random.seed()
-
 
 class Node:
     #Initialize the node with neighbour connections (to be randomized later)
     def __init__(self):
-        self.connections = []
+        self.connections = {}           #connected nodes, in the order they were connected (a dict used as an ordered set: O(1) to add, remove or look up)
         self.value = 0.0
         self.status = 0                 #statuses: 0- stay; 1-asking for energy; 2-offering energy (see run function)
         self.transactional_energy = 0.0 #ammount of energy to be transfered by the node
@@ -34,18 +33,16 @@ class Node:
         self.is_alive = True            #if the node is alive or not
 
     def add_connection(self, node_id):
-        if node_id not in self.connections:
-            self.connections.append(node_id)
+        self.connections[node_id] = None #an existing connection keeps its place
 
     def remove_connection(self, node_id):
-        if node_id in self.connections:
-            self.connections.remove(node_id)
+        self.connections.pop(node_id, None)
 
     def connect_to_neighbours(self, i, n_nodes, n_connections):
         for j in range(n_connections + 1):
             target = int((j + i - n_connections/2) % n_nodes) #Regular connection with neighbours 
             if target != i: #avoid self connections
-                self.connections.append(target) #Add connection to node
+                self.connections[target] = None #Add connection to node
 
 
 
@@ -55,6 +52,7 @@ class Network:
         self.n_nodes = n_nodes
         self.nodes = []
         self.values_list = [0]* n_nodes #store in a list the nodes values
+        self.endangered = 0 #live nodes out of the safe energy levels, after the last update_network
 
         for i in range(self.n_nodes):
             new_node = Node() #create the node
@@ -63,12 +61,10 @@ class Network:
     def initialize_from_genome(self, genome):
     #initialize connections, from the genome.
         #genome is an array with the positions, in the connections matrix, where there is connections.
-        for p in genome:
-            line = int((1 + math.sqrt(1 + 8*p)) / 2.0)
-            column = int(p - (line * (line-1)) / 2.0)
-
-            self.nodes[line].connections.append(column)
-            self.nodes[column].connections.append(line) #connect in both ways
+        lines, columns = genome_codec.decode(genome)
+        for line, column in zip(lines.tolist(), columns.tolist()):
+            self.nodes[line].connections[column] = None
+            self.nodes[column].connections[line] = None #connect in both ways
 
     def initialize_from_matrix(self, connections_matrix):
     #initialize connections, using a connections_matrix.
@@ -79,10 +75,16 @@ class Network:
         for i in range(self.n_nodes):
             for j in range(i):
                 if connections_matrix[position] == 1:
-                    self.nodes[i].connections.append(j)
-                    self.nodes[j].connections.append(i) #connect in both ways
+                    self.nodes[i].connections[j] = None
+                    self.nodes[j].connections[i] = None #connect in both ways
                 position += 1
 
+    def initialize_from_edges(self, src, dst):
+    #initialize connections, from arrays of edges (see generators.py): src[k] is connected to dst[k], in both ways
+        for origin, destination in zip(src.tolist(), dst.tolist()):
+            self.nodes[origin].connections[destination] = None
+            self.nodes[destination].connections[origin] = None
+
     #create an edge between nodes i and j
     def connect_nodes(self, i, j):
         self.nodes[i].add_connection(j)
@@ -91,19 +93,23 @@ class Network:
 
     def run(self, lower_limit, upper_limit):
     #run the network, allowing energy transfusions
-	
+    #returns the number of transfers (pairs asking/offering node) that happened
+        transfers = 0
+        nodes = self.nodes
 
         #First Round: each node decides to: 1-ask energy from neighbours 2-offer energy to neighbours 0-stay as it is
+        #(dead nodes keep their connections, but they are skipped: a dead node has no neighbours, and is no one's neighbour;
+        #the connections are filtered as they are read, see live_connections)
         for node in self.nodes: #first evaluate which nodes need energy, or will keep their levels
             #TODO: swap order
             if node.value < lower_limit: #if energy is too low
                 node.status = 1 #set status to "asking for energy"
                 node.transactional_energy = lower_limit - node.value #the ammount of energy to be received
-                node.candidates = sum(1.0 for i in node.connections if self.nodes[i].value > upper_limit) #amount of neighbours offering energy
+                node.candidates = sum(1.0 for i in node.connections if nodes[i].value > upper_limit and nodes[i].is_alive) if node.is_alive else 0.0 #amount of neighbours offering energy
             elif node.value > upper_limit: #if energy is too high
                 node.status = 2 #set status to "offering energy"
                 node.transactional_energy = node.value - upper_limit #the ammount of energy to be given away
-                node.candidates = sum(1.0 for i in node.connections if self.nodes[i].value < lower_limit) #amount of neighbours asking for energy
+                node.candidates = sum(1.0 for i in node.connections if nodes[i].value < lower_limit and nodes[i].is_alive) if node.is_alive else 0.0 #amount of neighbours asking for energy
             else: #if energy is nor low or high
                 node.status = 0 #sets status to stay as it is (ie: do nothing)
                 node.transactional_energy = 0.0
@@ -112,15 +118,15 @@ class Network:
         #Second Round: performs the energy transactions
         #a transaction occurs always when a node with status 1 (asking) is connected to one (or more) nodes with status 2 (offering)
         for node in self.nodes:
-            if node.status == 1: #found a node in need of energy
+            if node.status == 1 and node.is_alive: #found a node in need of energy
                 energy_avaiable = 0.0
                 for connection in node.connections: #first, check how much energy is avaiable in total
-                    neighbour = self.nodes[connection]
-                    if neighbour.status == 2:
+                    neighbour = nodes[connection]
+                    if neighbour.status == 2 and neighbour.is_alive:
                         energy_avaiable += neighbour.transactional_energy / neighbour.candidates #to be fair, the node will just receive a fraction of the neighbour's spare energy
                 for connection in node.connections:
-                    neighbour = self.nodes[connection]
-                    if neighbour.status == 2:
+                    neighbour = nodes[connection]
+                    if neighbour.status == 2 and neighbour.is_alive:
                         #if the total energy avaiable is less than what the node needs, the node accepts all the energy being offered
                         if energy_avaiable <= node.transactional_energy:
                             energy_offered = neighbour.transactional_energy / neighbour.candidates
@@ -136,12 +142,17 @@ class Network:
                         neighbour.value -= energy_transmited #rich node looses energy
                         neighbour.transactional_energy -= energy_transmited
                         neighbour.candidates -= 1.0
+                        transfers += 1
+        return transfers
 
 
 
     def update_network(self, lower_limit, upper_limit, endanger_limit):
         #check which nodes are under or above the safe energy levels
+        #returns the number of nodes that died (self.endangered keeps how many live nodes are out of the safe levels)
         i = 0
+        deaths = 0
+        self.endangered = 0
         for node in self.nodes:
             self.values_list[i] = node.value #update the values_list
             if node.is_alive:
@@ -152,20 +163,24 @@ class Network:
 
                 if node.endanger >= endanger_limit and node.is_alive: #kill node if it is in endanger condition for too many generations
                     self.remove_node(node, i)
+                    deaths += 1
+                elif node.endanger > 0:
+                    self.endangered += 1
             i += 1
+        return deaths
 
     def remove_node(self, node, node_index):
-        #remove node from network (i.e.: remove connections to and from it)
+        #remove node from network: its connections are kept, but run() skips the dead nodes (see live_connections), so a death costs O(1)
 
         #print(">>OMG, node", node_index, "is dead!")
-        #first remove the connections to this node
-        for connection in node.connections:
-            if connection != node_index: #don't remove connection to himself now, otherwise it will break the loop
-                self.nodes[connection].connections.remove(node_index)
-        #then, remove the connections of the node itself
-        node.connections.clear()
         node.is_alive = False
 
+    def live_connections(self, node):
+        #connections of the node that still exist: none if the node is dead, and only to live neighbours otherwise
+        if not node.is_alive:
+            return []
+        return [i for i in node.connections if self.nodes[i].is_alive]
+
     def count_survivors(self):
         survivors = 0
         deaths = 0
@@ -183,7 +198,7 @@ class Network:
     def print_network(self, show_connections=False): #Prints the value of each node (0 to _NODE_VALUES_RANGE) of the network on a single line
         values_str = ''
         for i in range(self.n_nodes):
-            connections_str = 'node ' + str(i) + ' is connected to: ' + ', '.join(str(x) for x in self.nodes[i].connections)
+            connections_str = 'node ' + str(i) + ' is connected to: ' + ', '.join(str(x) for x in self.live_connections(self.nodes[i]))
             if show_connections:
                 print(connections_str)
             values_str += str(self.nodes[i].value.__round__()) + ' '
@@ -217,16 +232,20 @@ class SmallWorldNetwork(Network):
 
     def reorder_edges(self, node_id, p):
         node = self.nodes[node_id]
-        for j in range(len(node.connections)): #For each connection, consider rewiring it.
+        connections = list(node.connections) #the new connections take the place of the old ones
+        for j in range(len(connections)): #For each connection, consider rewiring it.
             if random.random() < p: #Chance this connection will be rewired to a random node 
             #FIXME: should it be p/2 (as edges are considered twice?)
                 target = random.randint(0, self.n_nodes - 1) #Find newRewire randomly, obeying some constraints (see function valid_connection)
-                while (target == node_id) or (target in self.nodes[node_id].connections): #Can't connect to itself or to an already connected node
+                while (target == node_id) or (target in node.connections): #Can't connect to itself or to an already connected node
                     target = random.randint(0, self.n_nodes - 1)
-                old_target = node.connections[j]
+                old_target = connections[j]
                 self.nodes[old_target].remove_connection(node_id) #remove connection from old target
-                node.connections[j] = target #replace old connection to new target
+                node.remove_connection(old_target) #replace old connection to new target
+                node.add_connection(target)
+                connections[j] = target
                 self.nodes[target].add_connection(node_id)#add new connection on target node (two-way connection)
+        node.connections = dict.fromkeys(connections)
 
 class RandomNetwork(Network):
     """Network with random connected nodes
@@ -259,6 +278,7 @@ class GlobalNetwork(Network):
 
     def run(self, lower_limit, upper_limit):
     #run the network, allowing energy transfusions
+    #returns the number of transfers (every asking node with every offering node)
 
         full_nodes = []
         empty_nodes = []
@@ -305,6 +325,7 @@ class GlobalNetwork(Network):
             energy_used = 0
         for node in full_nodes:
            node.value -= energy_used * node.transactional_energy #rich node looses energy
+        return len(empty_nodes) * len(full_nodes)
 
 
 class VonNeumannNetwork(Network):
@@ -312,6 +333,8 @@ class VonNeumannNetwork(Network):
         Parameters: n_nodes, grid dimensions"""
     def __init__(self, n_nodes, grid_lines, grid_columns):
         Network.__init__(self, n_nodes)
+        self.grid_lines = grid_lines
+        self.grid_columns = grid_columns
 
         pos = 0
         for i in range(grid_lines):
@@ -384,11 +407,15 @@ class NoiseControl:
         return random_noise
 
     def apply_regular_noise(network, noise):
+        if not isinstance(network, Network): #array-backed networks (see array_network.py) apply the noise themselves
+            return network.apply_regular_noise(noise)
         for node in network.nodes:
             node.value = noise
 
     def apply_random_noise(network, predefined_noise=[], noise_range=_NODE_VALUES_RANGE, negative_range=True):
-        if predefined_noise: #if it is just applying a noise created befoere in random_noise_generator
+        if not isinstance(network, Network):
+            return network.apply_random_noise(predefined_noise, noise_range, negative_range)
+        if len(predefined_noise): #if it is just applying a noise created befoere in random_noise_generator
             for i in range(len(network.nodes)):
                 network.nodes[i].value += predefined_noise[i]
         else: #create a new noise patern now
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Pre-generated noise, shared by every individual of a generation."""
+
+import numpy as np
+from shared_array import SharedArray
+
+
+class NoiseBank:
+    """(tests x iterations x nodes) table of integer noise in [low, high), generated once from a seed and stored in shared memory.
+        Every individual reads the same table (bank[test, iteration] is the noise of all the nodes), so all of them face the
+        same perturbations, and pool workers map the table instead of receiving a copy of it.
+        Parameters: n_tests, n_iterations, n_nodes, low, high, seed"""
+    def __init__(self, n_tests, n_iterations, n_nodes, low, high, seed=None):
+        self.seed = seed
+        self.low = low
+        self.high = high
+        dtype = next(t for t in (np.int8, np.int16, np.int32, np.int64) if np.iinfo(t).min <= low and high - 1 <= np.iinfo(t).max) #smallest type that fits
+        self.noise = SharedArray((n_tests, n_iterations, n_nodes), dtype)
+
+        rng = np.random.default_rng(seed)
+        for test in range(n_tests): #one test at a time, to avoid a temporary copy of the whole table
+            self.noise[test] = rng.integers(low, high, (n_iterations, n_nodes), dtype=dtype)
+
+    def __getitem__(self, index):
+        return self.noise[index]
+
+    def __len__(self):
+        return len(self.noise)
+
+    def release(self):
+        #free the shared memory, once no worker needs the table anymore
+        self.noise.release()
@@ -2,13 +2,28 @@
 # -*- coding: utf-8 -*-
 
 import sys, os
+import argparse
 import random
-import datetime
 #import threading
-from multiprocessing import Pool
 import pickle
 from network import *
+from evaluator import make_evaluator, add_backend_arguments, cached_topology
+from array_network import Topology
+from noise_bank import NoiseBank
+import genome_codec
+import genetic_operators
+from checkpoint import CheckpointWriter, latest_checkpoint
+from metrics import MetricsWriter, PhaseTimer, fitness_summary, diversity
+import profiler
+from profiler import add_profile_argument
+from seeding import Seeding, add_seed_argument, genome_key
+from surrogate import Surrogate
+import numpy as np
 import math
+import time
+import itertools
+import collections
+import statistics
 #from numpy import var, std, sqrt
 
 
@@ -19,7 +34,18 @@ _GENERATIONS = 100                 #amount of generations the program will evolv
 _SELECTION_SAMPLE_SIZE = 2         #size of the random sample group where the best ranked will be father or mother
 _MUTATION_RATE = 0.02              #chance of gene being mutated
 _PARENTS_SELECTED = 0              #elitism
-_LOG_FILE = "logs/evolutionmulti.txt"
+_RACING = False                    #adaptive amount of tests (--racing): stop testing an individual once its fitness is settled, or clearly worse than the others
+_RACING_BATCH = 50                 #tests run between two checks
+_RACING_MIN_TESTS = 50             #tests run before the first check
+_RACING_MAX_TESTS = _TESTS_PER_INDIVIDUAL
+_RACING_CONFIDENCE = 0.95          #confidence of the interval of the mean fitness
+_RACING_TOLERANCE = 1.0            #the fitness is settled when the half width of its confidence interval is under it
+_RACING_REFERENCE = 0.5            #quantile of the previous generation fitness an individual must be able to reach to keep being tested
+_FITNESS_CACHE_SIZE = 1000         #amount of evaluated genomes whose fitness is remembered (reused by identical genomes and survivors)
+_SURROGATE = False                 #pre-screen the children with a model of their fitness, trained on the simulated ones (see surrogate.py)
+_SURROGATE_FRACTION = 0.5          #fraction of the bred children that is simulated (the most promising ones)
+_METRICS_FILE = "logs/evolutionmulti.jsonl" #one record per generation (see metrics.py)
+_CHECKPOINT_FILE = "execution/checkpoints.dat" #every evaluated generation is appended to it (see checkpoint.py)
 
 #network constrains
 _N_NODES = 1000                   #number of nodes in the network
@@ -32,73 +58,272 @@ _LOWER_ENERGY_LIMIT_DANGER = 40   #absolute lower limit. If the node stay bellow
 _UPPER_ENERGY_LIMIT_DANGER = 60   #absolute upper limit. If the node stay above this level for G generations, it dies
 _GENERATIONS_IN_DANGER_LIMIT = 3  #maximum # of generations the node can stay in danger level
 _MAX_ENERGY_INPUT = 10            #maximum amount of energy inputed to the system during execution
+_SHARED_NOISE = True              #all the individuals of a generation face the same noise (generated once, see noise_bank.py)
+_ENGINE = "ensemble"              #simulation engine: "object" (Network, list of Node objects), "array" (ArrayNetwork, NumPy arrays) or "ensemble" (EnsembleNetwork, all tests at once)
 
-_MATRIX_SIZE = int(((_N_NODES-1)*_N_NODES)/2)
+_MATRIX_SIZE = genome_codec.matrix_size(_N_NODES)
+
+#settings of racing (see tested_enough), sent to the workers with the context of the evaluations
+Racing = collections.namedtuple("Racing", ["min_tests", "max_tests", "batch", "confidence", "tolerance"])
+
+
+def racing_settings():
+    #Racing of the constants above, or None when _RACING is off
+    if not _RACING:
+        return None
+    return Racing(_RACING_MIN_TESTS, _RACING_MAX_TESTS, _RACING_BATCH, _RACING_CONFIDENCE, _RACING_TOLERANCE)
 
-random.seed()
 
 def run_individual(args):
+    #args: individual, noise, race_against, trials, racing; returns [genome, fitness, tests run]
+    individual = args[0]
+    fitness, tests = evaluate_genome(individual[0], args[1:])
+    individual[1] = fitness
+    return [individual[0], fitness, tests]
+
+
+def evaluate_genome(genome, context):
+    #fitness of the genome and the amount of tests run to get it
+    #context: noise (NoiseBank shared by the generation, or [] to draw new noise),
+    #         race_against (fitness the individual must be able to reach to keep being tested, with racing),
+    #         trials (Seeding of the streams of the tests of the generation, for the noise drawn when there is no NoiseBank),
+    #         racing (Racing settings, or None to run every test; by default, racing_settings())
 
     #print(">>starting process")
 
-    individual = args[0]
-    #noise = args[1]
+    noise = context[0]
+    race_against = context[1] if len(context) > 1 else None
+    trials = context[2] if len(context) > 2 else Seeding().child("trial")
+    racing = context[3] if len(context) > 3 else racing_settings()
+
+    topology = None
+    if _ENGINE != "object":
+        with profiler.phase("build"):
+            topology = cached_topology(_N_NODES, genome) #compiled once, shared by every test
+    else:
+        genome = list(genome)
 
-    partial_fitness = 0
+    #with racing, run the tests in batches, until the fitness is known well enough, or it is clearly worse than race_against
+    survivors = np.zeros(0)
+    while not tested_enough(survivors, race_against, racing):
+        first = len(survivors)
+        survivors = np.concatenate((survivors, run_tests(genome, topology, noise, first, next_tests(first, racing), trials)))
+    if len(survivors) < _TESTS_PER_INDIVIDUAL:
+        profiler.count("racing_stops")
 
-    for j in range(_TESTS_PER_INDIVIDUAL):
+    #network.print_network(True)
+    #print("<<closing process")
+    return float(survivors.mean()), len(survivors)
+
+
+def evaluate_genomes(genomes, context):
+    #evaluate_genome of several genomes at once: their networks run side by side, as the parts of one ensemble (see Topology.stack)
+    noise = context[0]
+    race_against = context[1] if len(context) > 1 else None
+    trials = context[2] if len(context) > 2 else Seeding().child("trial")
+    racing = context[3] if len(context) > 3 else racing_settings()
+
+    with profiler.phase("build"):
+        topologies = [cached_topology(_N_NODES, genome) for genome in genomes]
+    survivors = [np.zeros(0) for genome in genomes]
+    testing = list(range(len(genomes))) #genomes still being tested (all of them have run the same tests)
+    while testing:
+        first = len(survivors[testing[0]])
+        last = next_tests(first, racing)
+        streams = test_streams(trials, [genomes[i] for i in testing], first, last) if not len(noise) else None
+        batch = run_ensemble(Topology.stack([topologies[i] for i in testing]), noise, first, last, len(testing), streams)
+        for column, i in enumerate(testing):
+            survivors[i] = np.concatenate((survivors[i], batch[:, column]))
+        testing = [i for i in testing if not tested_enough(survivors[i], race_against, racing)]
+    profiler.count("racing_stops", sum(len(s) < _TESTS_PER_INDIVIDUAL for s in survivors))
+
+    return np.array([s.mean() for s in survivors]), np.array([len(s) for s in survivors])
+
+
+def next_tests(first, racing):
+    #end of the batch of tests that starts at the test first
+    if racing is None:
+        return _TESTS_PER_INDIVIDUAL
+    return min(max(first + racing.batch, racing.min_tests), racing.max_tests)
+
+
+def tested_enough(survivors, race_against, racing):
+    #whether the survivors of the tests run so far are enough to give the fitness
+    if racing is None:
+        return len(survivors) >= _TESTS_PER_INDIVIDUAL
+    if len(survivors) >= racing.max_tests:
+        return True
+    if len(survivors) < racing.min_tests:
+        return False
+    z = statistics.NormalDist().inv_cdf((1 + racing.confidence) / 2.0)
+    half_width = z * survivors.std(ddof=1) / math.sqrt(len(survivors)) #confidence interval of the mean
+    if half_width <= racing.tolerance: #settled
+        return True
+    return race_against is not None and survivors.mean() + half_width < race_against #dominated
+
+
+def test_streams(trials, genomes, first, last):
+    #without a noise bank: the random stream of each test first to last-1 of each genome (one list per test), derived from
+    #the genome and the number of the test (see seeding.py), so the noise doesn't depend on the worker or the batch running it
+    keys = [genome_key(genome) for genome in genomes]
+    return [[trials.rng(key, j) for key in keys] for j in range(first, last)]
+
+
+def draw_noise(streams):
+    #next iteration of noise of the tests of streams: one row per test, with the nodes of its genomes side by side
+    return np.array([np.concatenate([rng.integers(-_MAX_ENERGY_INPUT, _MAX_ENERGY_INPUT, _N_NODES) for rng in test]) for test in streams])
+
+
+def run_tests(genome, topology, noise, first, last, trials):
+    #survivors of the tests first to last-1 of the genome (with the noise of the same tests in the noise bank, or drawn from
+    #the streams of the tests, see test_streams)
+    streams = test_streams(trials, [genome], first, last) if not len(noise) else None
+    if _ENGINE == "ensemble":
+        return run_ensemble(topology, noise, first, last, 1, streams)[:, 0]
+
+    profiler.count("trials", last - first)
+    survivors_list = np.zeros(last - first)
+    for j in range(first, last):
         #generate network from genome 
-        network = Network(_N_NODES)
-        network.initialize_from_genome(individual[0])
+        with profiler.phase("build"):
+            if _ENGINE == "array":
+                network = topology.fresh_state()
+            else:
+                network = Network(_N_NODES)
+                network.initialize_from_genome(genome)
 
         #initialize network with the avg value
         NoiseControl.apply_regular_noise(network, (_LOWER_ENERGY_LIMIT_DANGER+_UPPER_ENERGY_LIMIT_DANGER)/2)
 
-        old_values_list = network.get_values()
-        similar_runs = 0
+        survivors = _N_NODES
         #run for certain time
         for k in range(_ITERATIONS):
             #[input energy]
-            NoiseControl.apply_random_noise(network, noise_range=_MAX_ENERGY_INPUT, negative_range=True)
+            with profiler.phase("noise"):
+                if len(noise):
+                    NoiseControl.apply_random_noise(network, noise[j, k])
+                else:
+                    NoiseControl.apply_random_noise(network, draw_noise(streams[j - first:j - first + 1])[0])
             #run network
-            network.run(_LOWER_ENERGY_LIMIT_RULE, _UPPER_ENERGY_LIMIT_RULE)
+            with profiler.phase("run"):
+                transfers = network.run(_LOWER_ENERGY_LIMIT_RULE, _UPPER_ENERGY_LIMIT_RULE)
+            profiler.count("transfers", transfers)
             #update network
-            network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+            with profiler.phase("update"):
+                deaths = network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+            profiler.count("deaths", deaths)
+            survivors -= deaths
             #[lose energy]
-            new_values_list = network.get_values()
-            if new_values_list == old_values_list: #check if there was really an update. if not, you don't need more iterations
-                similar_runs += 1
-            else:
-                similar_runs = 0
-            if similar_runs == 3:
+            #energy is inputed at every iteration, so the network never stops changing: only the death of every node ends the test earlier
+            if survivors == 0:
+                if k < _ITERATIONS - 1:
+                    profiler.count("early_exits")
                 break
-            old_values_list = new_values_list #update list os values for next iteration
 
         #evaluate fitness of the individual
-        indiv_fitness = network.count_survivors()
-        partial_fitness += indiv_fitness
-
-    #network.print_network(True)
-    fitness = partial_fitness / float(_TESTS_PER_INDIVIDUAL)
-    individual[1] = fitness
-    #print("<<closing process")
-    return individual
-
+        survivors_list[j - first] = network.count_survivors()
+    return survivors_list
+
+
+def run_ensemble(topology, noise, first, last, copies=1, streams=None):
+    #same tests as run_tests, but all of them advance together as a (tests x nodes) state matrix
+    #topology can be copies networks side by side (see evaluate_genomes): each one gets the same noise, and its own survivors column
+    #(without a noise bank, each one gets the noise of its own streams, see test_streams)
+    profiler.count("trials", (last - first) * copies)
+    with profiler.phase("build"):
+        network = topology.fresh_ensemble(last - first)
+
+    #initialize network with the avg value
+    NoiseControl.apply_regular_noise(network, (_LOWER_ENERGY_LIMIT_DANGER+_UPPER_ENERGY_LIMIT_DANGER)/2)
+
+    #run for certain time
+    for k in range(_ITERATIONS):
+        #[input energy]
+        with profiler.phase("noise"):
+            if len(noise):
+                NoiseControl.apply_random_noise(network, np.tile(noise[first + network.trials, k], copies))
+            else:
+                NoiseControl.apply_random_noise(network, draw_noise([streams[t] for t in network.trials]))
+        #run network
+        with profiler.phase("run"):
+            transfers = network.run(_LOWER_ENERGY_LIMIT_RULE, _UPPER_ENERGY_LIMIT_RULE)
+        profiler.count("transfers", transfers.sum())
+        #update network
+        with profiler.phase("update"):
+            deaths = network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+        profiler.count("deaths", deaths.sum())
+        #energy is inputed at every iteration, so only the tests where every node is dead are over
+        with profiler.phase("convergence"):
+            finished = network.count_alive() == 0
+            network.retire(finished)
+        if k < _ITERATIONS - 1:
+            profiler.count("early_exits", np.count_nonzero(finished) * copies)
+        if len(network.trials) == 0:
+            break
+
+    #evaluate fitness of the individual
+    return network.alive_matrix().reshape(last - first, copies, _N_NODES).sum(axis=2)
+
+
+class FitnessCache:
+    """Remembers the fitness of the last max_size evaluated genomes (the least recently used are forgotten)
+        Parameters: max_size"""
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.fitness = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(genome):
+        return genome_codec.canonical_key(genome)
+
+    def get(self, key):
+        #fitness of the genome with this key, or None if it was not evaluated
+        if key in self.fitness:
+            self.fitness.move_to_end(key)
+            self.hits += 1
+            return self.fitness[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, fitness):
+        self.fitness[key] = fitness
+        self.fitness.move_to_end(key)
+        while len(self.fitness) > self.max_size:
+            self.fitness.popitem(last=False)
 
 
 class Evolution:
-    def __init__(self, population_size, n_nodes, total_connections, start_from_file=False, bkp_file_path=""):
+    def __init__(self, population_size, n_nodes, total_connections, start_from_file=False, bkp_file_path="", evaluator=None, checkpoint_path=_CHECKPOINT_FILE, resume=False, seeding=None, metrics_path=None, surrogate=None, racing=None):
         self.individuals = []
         self.n_nodes = n_nodes
         self.pop_size = population_size
         self.noise = []
         self.generation = 0 #keep track of which generation is currently in
-        #paralelizing the work
-        self.pool = Pool()
-
-        #initialize the log file
-        self.log_file = open(_LOG_FILE, 'a')
-        t0 = datetime.datetime.now()
+        self.fitness_cache = FitnessCache(_FITNESS_CACHE_SIZE)
+        self.cache_hits = 0 #genomes of the current generation that didn't need to be evaluated
+        self.cache_misses = 0
+        self.tests_run = 0 #tests actually run in the current generation (fewer than _TESTS_PER_INDIVIDUAL per individual with racing)
+        self.previous_fitness = [] #sorted fitness of the last evaluated generation
+        self.racing = racing #Racing settings of the evaluations (see racing_arguments), or None to run every test
+        self.report_time = time.perf_counter() #end of the last generation printed (for the evaluations per second)
+        #paralelizing the work (the workers stay alive during the whole evolution), see evaluator.py
+        self.evaluator = evaluator or make_evaluator("process", evaluate_genome)
+        checkpoint = latest_checkpoint(checkpoint_path) if resume else None
+        self.checkpoints = CheckpointWriter(checkpoint_path) #written in background
+        #every random draw comes from a stream of the master seed (see seeding.py); a resumed run keeps the seed of its checkpoint
+        self.seeding = Seeding.from_state(checkpoint.state["seeding"]) if checkpoint is not None else seeding or Seeding()
+        self.timer = PhaseTimer() #wall time of the phases of each generation
+        self.surrogate = surrogate #Surrogate that pre-screens the children of evolute, or None to simulate all of them
+        self.surrogate_record = None #its record of the last generation
+        if surrogate is not None and checkpoint is not None and "surrogate" in checkpoint.state:
+            surrogate.restore(checkpoint.state["surrogate"])
+        self.profile = {"phases": {}, "counters": {}} #profile of the whole run, with --profile (see profiler.py)
+        self.metrics = MetricsWriter(metrics_path or _METRICS_FILE, {"script": "phase2_evolution", "population": population_size, "nodes": n_nodes,
+                                                     "connections": total_connections, "tests": _TESTS_PER_INDIVIDUAL, "seed": self.seeding.seed,
+                                                     "resumed_from": checkpoint.generation if checkpoint is not None else None,
+                                                     "bkp_file": bkp_file_path if start_from_file else None})
 
         #each individual is represented by an array, of size |total_connections|, with the 'address' of its connections in the connections_matrix
         self.genome_size = total_connections
@@ -107,53 +332,100 @@ class Evolution:
         #(i.e: When connections_matrix[i][j] == 1, there is a connection between nodes i and j)
         #To save space, as [i][j] == [j][i] (the graph isn't directional) and i != j (no self connections),
         # we will just store the triangular part of the matrix, above the main diagonal, in an array.
-        self.matrix_size = int(((n_nodes - 1)*n_nodes)/2) #this is the size of the triangular region lower to the main diagonal of the matrix.
+        self.matrix_size = genome_codec.matrix_size(n_nodes) #this is the size of the triangular region lower to the main diagonal of the matrix.
 
-        if not start_from_file: #create individuals randomly
+        if checkpoint is not None: #continue from the last checkpoint of a previous execution
+            self.restore(checkpoint)
+        elif not start_from_file: #create individuals randomly
             #generate individuals as samples of |genome_size| from the possible connections_matrix slots.
+            population_random = random.Random(self.seeding.integer("population"))
             for i in range(population_size):
-                connections = random.sample(range(self.matrix_size), self.genome_size) #get a genome_size sample in a matrix_size range
+                connections = population_random.sample(range(self.matrix_size), self.genome_size) #get a genome_size sample in a matrix_size range
                 self.individuals.append([connections,0.0]) #add individual and fitness to individual array
-            self.log_file.write("--------------------------- " + str(t0) + " -----------------------------" + "\n")
-
-        if start_from_file: #created individuals from a previous execution (used to continue broken executions)
+        else: #created individuals from a previous execution (used to continue broken executions)
             bkp_file = open(bkp_file_path, "rb")
             self.individuals = pickle.load(bkp_file)
-            self.log_file.write(">>>>>>>>>>>>>>>>> Continuing from previous execution. " + str(t0) + "\n")
             import re
             self.generation = int(re.search('\d+', bkp_file_path).group())
 
-        self.log_file.close()
 
+    def checkpoint_state(self):
+        #what a resumed run needs besides the population: the master seed (and the surrogate model)
+        state = {"seeding": self.seeding.state()}
+        if self.surrogate is not None:
+            state["surrogate"] = self.surrogate.state()
+        return state
 
-    def step(self):
+    def restore(self, checkpoint):
+        #continue an evolution from a checkpoint: its population was already evaluated, so the next generation is bred from it
+        self.individuals = [[genome, fitness] for genome, fitness in zip(checkpoint.genomes.tolist(), checkpoint.fitness.tolist())]
+        self.generation = checkpoint.generation
+        self.previous_fitness = [individual[1] for individual in self.individuals]
+        self.evolute()
 
-        #save population in a file, to be able to restore it
-        filename = "execution/genome"
-        bkp = open("execution/genome_"+str(self.generation)+"_initial.dat", "wb")
-        pickle.dump(self.individuals, bkp)
-        bkp.close()
+    def close(self):
+        #stop the workers, and wait for the last checkpoint and metrics to be written
+        self.evaluator.close()
+        self.metrics.close()
+        self.checkpoints.close() #last: raises if a checkpoint couldn't be written
 
 
+    def step(self):
+
         #generate random noise to be inputed in all networks tested in this generation
-        #for i in range(_TESTS_PER_INDIVIDUAL):
-        #    self.noise.append(NoiseControl.random_noise_generator(self.n_nodes, _NODE_VALUES_RANGE))
+        if _SHARED_NOISE:
+            with self.timer.phase("noise"):
+                self.noise = NoiseBank(_TESTS_PER_INDIVIDUAL, _ITERATIONS, self.n_nodes, -_MAX_ENERGY_INPUT, _MAX_ENERGY_INPUT, self.seeding.integer("noise", self.generation))
 
         #old:
         #for i in range(self.pop_size):
         #    self.run_individual(i) 
 
-        args = [[self.individuals[i], self.noise] for i in range(self.pop_size)]
-        self.individuals = self.pool.map(run_individual, args)
+        #evaluate each distinct genome once (identical children and unchanged survivors reuse the known fitness)
+        hits, misses = self.fitness_cache.hits, self.fitness_cache.misses
+        keys = [FitnessCache.key(individual[0]) for individual in self.individuals]
+        fitness = {}
+        to_evaluate = {}
+        for key, individual in zip(keys, self.individuals):
+            if key in fitness or key in to_evaluate:
+                self.fitness_cache.hits += 1
+                continue
+            cached = self.fitness_cache.get(key)
+            if cached is None:
+                to_evaluate[key] = individual[0]
+            else:
+                fitness[key] = cached
+
+        #with racing, an individual is only tested until it is clearly worse than most of the previous generation
+        race_against = None
+        if self.racing is not None and self.previous_fitness:
+            race_against = self.previous_fitness[int(_RACING_REFERENCE * (len(self.previous_fitness) - 1))]
+
+        with self.timer.phase("evaluate"):
+            new_fitness, tests = self.evaluator.map(list(to_evaluate.values()), (self.noise, race_against, self.seeding.child("trial", self.generation), self.racing))
+        for key, genome_fitness in zip(to_evaluate, new_fitness.tolist()):
+            fitness[key] = genome_fitness
+            self.fitness_cache.put(key, genome_fitness)
+        if self.surrogate is not None:
+            with self.timer.phase("surrogate"):
+                self.surrogate_record = self.surrogate.learn(list(to_evaluate.values()), new_fitness.tolist())
+        self.tests_run = int(tests.sum())
+        for key, individual in zip(keys, self.individuals):
+            individual[1] = fitness[key]
+        if _SHARED_NOISE:
+            self.noise.release()
+            self.noise = []
+        self.cache_hits = self.fitness_cache.hits - hits
+        self.cache_misses = self.fitness_cache.misses - misses
 
         #order individuals by fitness
         self.individuals.sort(key = lambda x: x[1]) #Sort the sample by fitness
+        self.previous_fitness = [individual[1] for individual in self.individuals]
 
 
-        #copy genome population to a file, to be able to start from this population, in case of broken execution
-        bkp = open("execution/genome_"+str(self.generation)+"_fitness.dat", "wb")
-        pickle.dump(self.individuals, bkp)
-        bkp.close()
+        #save the evaluated population (with the master seed), to be able to continue from it, in case of broken execution
+        with self.timer.phase("checkpoint"):
+            self.checkpoints.save(self.generation, [individual[0] for individual in self.individuals], self.previous_fitness, self.checkpoint_state())
 
 
     def evolute(self):
@@ -163,114 +435,246 @@ class Evolution:
         for i in range(_PARENTS_SELECTED):
             new_generation.append([self.individuals[self.pop_size-1-i][0], 0])
 
-        #create the rest as combination of two parents
-        for i in range(self.pop_size - _PARENTS_SELECTED):
-            #select parents to reproduce
-            father = self.select(_SELECTION_SAMPLE_SIZE)
-            mother = self.select(_SELECTION_SAMPLE_SIZE)
-            #generate new individuals
-            child = self.sex(father, mother, _MUTATION_RATE)
-            new_generation.append([child, 0])
+        #create the rest as combination of two parents: tournament selection, crossover and mutation, all at once (see genetic_operators.py)
+        #the mutation creates a new edge, changing only one side of it (keeping one of the nodes with the same number of connections)
+        population = [individual[0] for individual in self.individuals]
+        fitness = [individual[1] for individual in self.individuals]
+        n_children = self.pop_size - _PARENTS_SELECTED
+        with self.timer.phase("breed"):
+            rng = self.seeding.rng("breeding", self.generation)
+            bred = self.surrogate.bred(n_children) if self.surrogate is not None else n_children
+            children = genetic_operators.breed(population, fitness, bred, _SELECTION_SAMPLE_SIZE, _MUTATION_RATE, self.n_nodes, rng, keep_node=True)
+        if self.surrogate is not None: #only the most promising children are simulated
+            with self.timer.phase("surrogate"):
+                children = children[self.surrogate.screen(children, n_children)]
+        for child in children:
+            new_generation.append([child.tolist(), 0])
 
         self.individuals = new_generation #Exchange old individuals with the new generation
         self.generation += 1
 
 
-    def select(self, sample_size):
-        sample = random.sample(self.individuals, sample_size) #get a sample, to select the parent
-        sample.sort(key = lambda x: x[1]) #Sort the sample by fitness
-        return sample[-1][0] #Return phenotype of the best individual
-
-    def sex(self, father, mother, mutation_rate):
-        #1-crossover
-        #put the parents genes in a bag, removing duplicates
-        bag = list(set(father+mother))
-        #the child will be a sample from this bag
-        child = random.sample(bag, self.genome_size)
-
-        #2-mutation
-        for i in range(len(child)): #There is a mutation_rate of being changed for each gene of the phenotype
-            if random.random() < mutation_rate:
-                #the mutation will create a new edge, changing only one side of it (keeping one of the nodes with the same number of connections)
-                old_gene_line, old_gene_column = self.array_to_matrix(child[i])
-                new_gene_column = random.randrange(self.n_nodes) #choose which node will receive the new end of the edge
-                new_gene = self.matrix_to_array(old_gene_line, new_gene_column)
-                while(new_gene in child): #it need to be unique
-                    new_gene_column = random.randrange(self.n_nodes)
-                    new_gene = self.matrix_to_array(old_gene_line, new_gene_column)
-                child[i] = new_gene
-
-        return child
+    def steady_state(self, evaluations):
+        #asynchronous evolution, without generation barriers: results are used as soon as they arrive, and the worker that sent one
+        #gets a new child at once. The children are bred from the live population (tournament selection, as evolute) and take the
+        #place of the loser of a reverse tournament when they are fitter (see replace). Every pop_size individuals evaluated count as
+        #a generation: printed, recorded and checkpointed. evaluations: individuals to evaluate, the current ones included
+        #the whole run faces the same noise (live individuals are compared with the ones of any age), and the results arrive in the
+        #order the workers finish them, so only the serial backend gives the same run from the same seed
+        if _SHARED_NOISE:
+            with self.timer.phase("noise"):
+                self.noise = NoiseBank(_TESTS_PER_INDIVIDUAL, _ITERATIONS, self.n_nodes, -_MAX_ENERGY_INPUT, _MAX_ENERGY_INPUT, self.seeding.integer("noise", self.generation))
+        trials = self.seeding.child("trial", self.generation)
+        rng = self.seeding.rng("breeding", self.generation)
+
+        waiting = collections.deque(individual[0] for individual in self.individuals) #not evaluated yet, sent before any child
+        self.individuals = []
+        submitted = {} #tag -> genome of the evaluations running
+        known = collections.deque() #individuals whose fitness was in the cache, (genome, fitness)
+        tags = itertools.count()
+        context = None #same object while it doesn't change, so the vectorized backend can batch its evaluations
+        issued = 0
+        hits, misses = self.fitness_cache.hits, self.fitness_cache.misses
+        self.tests_run = 0
+        for done in range(evaluations):
+            #keep every worker busy
+            while issued < evaluations and self.evaluator.running < self.evaluator.slots and (waiting or self.individuals):
+                issued += 1
+                if waiting:
+                    genome = waiting.popleft()
+                else:
+                    with self.timer.phase("breed"):
+                        genome = self.breed_child(rng)
+                key = FitnessCache.key(genome)
+                cached = self.fitness_cache.get(key)
+                if cached is not None:
+                    known.append((genome, cached))
+                    continue
+                tag = next(tags)
+                submitted[tag] = genome
+                race_against = self.race_against()
+                if context is None or context[1] != race_against:
+                    context = (self.noise, race_against, trials, self.racing)
+                self.evaluator.submit(genome, context, tag)
+
+            if known:
+                genome, fitness = known.popleft()
+            else:
+                with self.timer.phase("evaluate"):
+                    tag, fitness, tests = self.evaluator.next_result()
+                genome = submitted.pop(tag)
+                self.fitness_cache.put(FitnessCache.key(genome), fitness)
+                self.tests_run += int(tests)
+            self.replace(genome, fitness, rng)
+
+            if (done + 1) % self.pop_size == 0 or done + 1 == evaluations:
+                self.individuals.sort(key = lambda x: x[1])
+                self.previous_fitness = [individual[1] for individual in self.individuals]
+                self.cache_hits = self.fitness_cache.hits - hits
+                self.cache_misses = self.fitness_cache.misses - misses
+                with self.timer.phase("checkpoint"):
+                    self.checkpoints.save(self.generation, [individual[0] for individual in self.individuals], self.previous_fitness, self.checkpoint_state())
+                self.print_results()
+                self.generation += 1
+                hits, misses = self.fitness_cache.hits, self.fitness_cache.misses
+                self.tests_run = 0
+
+        if _SHARED_NOISE:
+            self.noise.release()
+            self.noise = []
+
+    def immigrate(self, migrants):
+        #island model (see islands.py): the migrants (genome, fitness) of other islands take the place of the least fit individuals
+        #of the evaluated population (genomes already in it are skipped). The checkpoint of the generation is saved again with them,
+        #so a resumed island continues from its population after the migration
+        present = set(FitnessCache.key(individual[0]) for individual in self.individuals)
+        arrivals = []
+        for genome, fitness in migrants:
+            key = FitnessCache.key(genome)
+            if key not in present:
+                present.add(key)
+                arrivals.append([list(genome), fitness])
+        arrivals = arrivals[:self.pop_size - 1] #the best individual always stays
+        self.individuals[:len(arrivals)] = arrivals
+        self.individuals.sort(key = lambda x: x[1])
+        self.previous_fitness = [individual[1] for individual in self.individuals]
+        with self.timer.phase("checkpoint"):
+            self.checkpoints.save(self.generation, [individual[0] for individual in self.individuals], self.previous_fitness, self.checkpoint_state())
+        return len(arrivals)
+
+    def breed_child(self, rng):
+        #a child of two parents of the live population, chosen by tournament (see evolute)
+        population = [individual[0] for individual in self.individuals]
+        fitness = [individual[1] for individual in self.individuals]
+        return genetic_operators.breed(population, fitness, 1, _SELECTION_SAMPLE_SIZE, _MUTATION_RATE, self.n_nodes, rng, keep_node=True)[0].tolist()
+
+    def replace(self, genome, fitness, rng):
+        #steady state: a new individual joins the population while it isn't full, then it takes the place of the
+        #least fit of a random sample of _SELECTION_SAMPLE_SIZE individuals, if it is at least as fit
+        if len(self.individuals) < self.pop_size:
+            self.individuals.append([genome, fitness])
+            return
+        loser = genetic_operators.tournament([-individual[1] for individual in self.individuals], 1, _SELECTION_SAMPLE_SIZE, rng)[0]
+        if fitness >= self.individuals[loser][1]:
+            self.individuals[loser] = [genome, fitness]
+
+    def race_against(self):
+        #with racing, the fitness a new individual must be able to reach to keep being tested (see step)
+        if self.racing is None or not self.individuals:
+            return None
+        fitness = sorted(individual[1] for individual in self.individuals)
+        return fitness[int(_RACING_REFERENCE * (len(fitness) - 1))]
+
 
     def matrix_to_array(self, line, column):
         #given a pair of lower triangular matrix coordinates, return its position in an compacted array
-        pos = int( (line * (line - 1)) / 2 + column)
-        return pos
+        return genome_codec.encode(line, column)
 
     def array_to_matrix(self, pos):
         #given an position in an array, return it equivalent position in a matrix
-        line = int((1 + math.sqrt(1 + 8*pos)) / 2.0)
-        column = int(pos - (line * (line-1)) / 2.0)
-
-        return line, column
+        return genome_codec.decode_gene(pos)
 
 
     def print_results(self):
-        #print best result, avg result, median, worst and the phenotype (represented in hexadecimal) of the best result
-        best = self.individuals[self.pop_size-1][1] #self.individuals list was sorted in beggining of evolution method
-        median = self.individuals[round(self.pop_size/2)][1]
-        worst = self.individuals[0][1]
-        fitness_sum = sum([fit[1] for fit in  self.individuals])
-        avg = fitness_sum/float(self.pop_size)
-
-        best_phenotype = self.individuals[self.pop_size-1][0].copy()
-        best_phenotype.sort()
+        #print best result, avg result, median and worst, and add the record of the generation to the metrics (the genomes are in the checkpoints)
+        fitness = [individual[1] for individual in self.individuals]
+        record = dict(generation=self.generation, **fitness_summary(fitness))
+        now = time.perf_counter()
+        record.update(diversity=diversity([individual[0] for individual in self.individuals]), evaluations=self.cache_misses,
+                      cache_hits=self.cache_hits, tests=self.tests_run, evaluations_per_second=round(self.cache_misses / max(now - self.report_time, 1e-9), 3),
+                      phases=self.timer.reset())
+        self.report_time = now
+        if self.surrogate_record is not None:
+            record["surrogate"] = self.surrogate_record
+        profile = profiler.take() #simulation phases and counters of every worker, with --profile
+        if profile is not None:
+            record["profile"] = profile
+            profiler.merge(profile, self.profile)
 
         #print in the output
         print("generation:", self.generation)
-        print("Best =", best, "avg =", avg, "median=", median, "worst =", worst)
-        #print("Best phenotype:")
-        #print(best_phenotype)
+        print("Best =", record["best"], "avg =", record["avg"], "median=", record["median"], "worst =", record["worst"])
+        print("evaluated =", self.cache_misses, "cache hits =", self.cache_hits, "tests =", self.tests_run, "evaluations/s =", record["evaluations_per_second"])
+        if self.surrogate_record is not None:
+            print("surrogate: spearman =", self.surrogate_record["spearman"], "screened out =", self.surrogate_record["screened"], "samples =", self.surrogate_record["samples"])
+
+        #print in file (buffered, see metrics.py)
+        self.metrics.write(record)
 
-        #print in file
-        self.log_file = open(_LOG_FILE, 'a') #open and close file every print, to save broken executions
 
-        self.log_file.write("generation: " + str(self.generation) + "\n")
-        self.log_file.write("Best = " + str(best) + " avg = " + str(avg) + " median= " + str(median) + " worst = " + str(worst) + "\n")
-        self.log_file.write("Best phenotype:" + "\n")
-        self.log_file.write(str(best_phenotype) + "\n")
 
-        self.log_file.close()
+def add_racing_arguments(parser):
+    #command line options of racing (see racing_arguments)
+    parser.add_argument("--racing", action="store_true", default=_RACING, help="adaptive amount of tests: stop testing an individual once its fitness is settled, or clearly worse than the others")
+    parser.add_argument("--racing-confidence", type=float, default=_RACING_CONFIDENCE, help="confidence of the interval of the mean fitness (default: %(default)s)")
+    parser.add_argument("--racing-min-tests", type=int, default=_RACING_MIN_TESTS, help="tests run before the first check (default: %(default)s)")
+    parser.add_argument("--racing-max-tests", type=int, default=_RACING_MAX_TESTS, help="tests run at most (default: %(default)s, all of them)")
 
 
+def racing_arguments(parser, args):
+    #Racing of the options of add_racing_arguments, or None without --racing
+    if not args.racing:
+        return None
+    if not 0 < args.racing_confidence < 1:
+        parser.error("--racing-confidence must be between 0 and 1")
+    if not 2 <= args.racing_min_tests <= args.racing_max_tests <= _TESTS_PER_INDIVIDUAL:
+        parser.error("racing needs 2 <= --racing-min-tests <= --racing-max-tests <= %d tests" % _TESTS_PER_INDIVIDUAL)
+    return Racing(args.racing_min_tests, args.racing_max_tests, _RACING_BATCH, args.racing_confidence, _RACING_TOLERANCE)
+
 
 def program(argv):
 
+    parser = argparse.ArgumentParser(description="Evolution of the network topology")
+    parser.add_argument("bkp_file", nargs="?", default="", help="population pickled by a previous execution, to continue from it")
+    parser.add_argument("--resume", action="store_true", help="continue from the last complete checkpoint")
+    parser.add_argument("--checkpoint", default=_CHECKPOINT_FILE, help="checkpoint file (default: %(default)s)")
+    parser.add_argument("--surrogate", action="store_true", default=_SURROGATE, help="only simulate the most promising children, scored by a model of the fitness (see surrogate.py)")
+    parser.add_argument("--steady-state", action="store_true", help="no generation barriers: each worker gets a new child as soon as it is free (see Evolution.steady_state)")
+    add_racing_arguments(parser)
+    add_backend_arguments(parser)
+    add_profile_argument(parser)
+    add_seed_argument(parser)
+    args = parser.parse_args(argv[1:])
+    racing = racing_arguments(parser, args)
+    profiler.enable(args.profile) #before the workers are started
+
     #evolution of the network
-    if len(argv) > 1:
-        bkp_file = argv[1]
-        use_file = True
-    else:
-        bkp_file = ""
-        use_file = False
+    bkp_file = args.bkp_file
+    use_file = bkp_file != ""
+    evaluator = make_evaluator(args.backend, evaluate_genome, evaluate_genomes, args.workers, args.batch_size)
 
     #generate initial population P
-    evolution = Evolution(_POPULATION_SIZE, _N_NODES, _TOTAL_CONNECTIONS, use_file, bkp_file)
-    for i in range(_GENERATIONS):
-        print(">>>>>>GENERATION", i)
-        #run program
-        evolution.step()
-        evolution.print_results()
-        #evolve
-        evolution.evolute()
+    surrogate = Surrogate(_N_NODES, _SURROGATE_FRACTION) if args.surrogate else None
+    evolution = Evolution(_POPULATION_SIZE, _N_NODES, _TOTAL_CONNECTIONS, use_file, bkp_file, evaluator, args.checkpoint, args.resume, Seeding(args.seed),
+                          surrogate=surrogate, racing=racing)
+    print("seed:", evolution.seeding.seed)
+    start = time.perf_counter()
+    evaluations = evolution.fitness_cache.misses
+    if args.steady_state:
+        #the same amount of individuals as the generations left
+        evolution.steady_state((_GENERATIONS - evolution.generation) * _POPULATION_SIZE)
+    else:
+        for i in range(evolution.generation, _GENERATIONS):
+            print(">>>>>>GENERATION", i)
+            #run program
+            evolution.step()
+            evolution.print_results()
+            #evolve
+            evolution.evolute()
+    evaluations = evolution.fitness_cache.misses - evaluations
+    seconds = time.perf_counter() - start
+    print(">>>>>>THROUGHPUT:", evaluations, "evaluations in", round(seconds, 3), "s =", round(evaluations / seconds, 3), "evaluations/s")
+    evolution.close()
     print(">>>>>>FINAL RESULT:")
     for i in range(len(evolution.individuals)):
             print(evolution.individuals[i][0])
+    if profiler.enabled():
+        print(">>>>>>PROFILE:")
+        print(profiler.summary(evolution.profile))
 
 def main(argv):
 
-    #import cProfile
-    #cProfile.run("program(sys.argv)", "test.profile")
+    #timers and counters of the simulation: --profile (see profiler.py)
     program(argv)
 
 if __name__ == "__main__":
@@ -1,10 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import sys
+import argparse
 import random
-import datetime
-import threading
 from network import *
+from evaluator import make_evaluator, add_backend_arguments, cached_topology
+from array_network import Topology
+from noise_bank import NoiseBank
+import genome_codec
+import genetic_operators
+from checkpoint import CheckpointWriter
+from metrics import MetricsWriter, PhaseTimer, fitness_summary, diversity
+import profiler
+from profiler import add_profile_argument
+from seeding import Seeding, add_seed_argument
+import numpy as np
 
 #evolution constrains
 _POPULATION_SIZE = 500            #size of genome's population
@@ -13,7 +24,8 @@ _GENERATIONS = 50                 #amount of generations the program will evolve
 _SELECTION_SAMPLE_SIZE = 20       #size of the random sample group where the best ranked will be father or mother
 _MUTATION_RATE = 0.02             #chance of gene being mutated
 _PARENTS_SELECTED = 0             #number of individuals that will stay without crossover or mutation for the next generation (elitist selection)
-_LOG_FILE = "logs/evolution100thread.txt"
+_METRICS_FILE = "logs/evolution100thread.jsonl" #one record per generation (see metrics.py)
+_CHECKPOINT_FILE = "execution/checkpoints_thread.dat" #every evaluated generation is appended to it (see checkpoint.py)
 
 #network constrains
 _N_NODES = 100                    #number of nodes in the network
@@ -26,22 +38,111 @@ _LOWER_ENERGY_LIMIT_DANGER = 30   #absolute lower limit. If the node stay bellow
 _UPPER_ENERGY_LIMIT_DANGER = 70   #absolute upper limit. If the node stay above this level for G generations, it dies
 _GENERATIONS_IN_DANGER_LIMIT = 3  #maximum # of generations the node can stay in danger level
 _MAX_ENERGY_INPUT = 10            #maximum amount of energy inputed to the system 
+_ENGINE = "ensemble"              #simulation engine: "object" (Network, list of Node objects) or "ensemble" (EnsembleNetwork, all tests at once)
 
 
-random.seed()
+
+def evaluate_genome(genome, context):
+    #fitness of the genome and the amount of tests run to get it
+    #context: noise (NoiseBank with the initial values of the nodes in every test)
+    noise = context[0]
+
+    if _ENGINE == "ensemble":
+        #the genes in increasing order give the connections in the same order as initialize_from_matrix
+        with profiler.phase("build"):
+            topology = cached_topology(_N_NODES, np.sort(genome))
+        return float(run_ensemble(topology, noise)[:, 0].mean()), _TESTS_PER_INDIVIDUAL
+
+    #generate connections_matrix, from the genome
+    connections_matrix = [0] * genome_codec.matrix_size(_N_NODES) #initialize with zeroes
+    for connection in genome:
+        connections_matrix[connection] = 1 #replace to 1, the edges indicated in the genome
+
+    partial_fitness = 0
+
+    profiler.count("trials", _TESTS_PER_INDIVIDUAL)
+    for j in range(_TESTS_PER_INDIVIDUAL):
+        #generate network from genome 
+        with profiler.phase("build"):
+            network = Network(_N_NODES)
+            network.initialize_from_matrix(connections_matrix)
+
+        #initialize network with values
+        with profiler.phase("noise"):
+            NoiseControl.apply_random_noise(network, noise[j, 0])
+
+        #run for certain time
+        for k in range(_ITERATIONS):
+            #[input energy]
+            #NoiseControl.apply_random_noise(network, noise_range=_MAX_ENERGY_INPUT)
+            #run network
+            with profiler.phase("run"):
+                transfers = network.run(_LOWER_ENERGY_LIMIT_RULE, _UPPER_ENERGY_LIMIT_RULE)
+            profiler.count("transfers", transfers)
+            #update network
+            with profiler.phase("update"):
+                deaths = network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+            profiler.count("deaths", deaths)
+            #[lose energy]
+
+        #evaluate fitness of the individual
+        partial_fitness += network.count_survivors()
+    #network.print_network(True)
+    fitness = partial_fitness / float(_TESTS_PER_INDIVIDUAL)
+    return fitness, _TESTS_PER_INDIVIDUAL
+
+
+def evaluate_genomes(genomes, context):
+    #evaluate_genome of several genomes at once: their networks run side by side, as the parts of one ensemble (see Topology.stack)
+    with profiler.phase("build"):
+        topology = Topology.stack([cached_topology(_N_NODES, np.sort(genome)) for genome in genomes])
+    fitness = run_ensemble(topology, context[0], len(genomes)).mean(axis=0)
+    return fitness, np.full(len(genomes), _TESTS_PER_INDIVIDUAL)
+
+
+def run_ensemble(topology, noise, copies=1):
+    #survivors of every test (one row per test, one column per network of the topology, when it has copies networks side by side)
+    profiler.count("trials", _TESTS_PER_INDIVIDUAL * copies)
+    with profiler.phase("build"):
+        network = topology.fresh_ensemble(_TESTS_PER_INDIVIDUAL)
+
+    #initialize network with values
+    with profiler.phase("noise"):
+        NoiseControl.apply_random_noise(network, np.tile(noise[:_TESTS_PER_INDIVIDUAL, 0], copies))
+
+    #run for certain time
+    for k in range(_ITERATIONS):
+        #run network
+        with profiler.phase("run"):
+            transfers = network.run(_LOWER_ENERGY_LIMIT_RULE, _UPPER_ENERGY_LIMIT_RULE)
+        profiler.count("transfers", transfers.sum())
+        #update network
+        with profiler.phase("update"):
+            deaths = network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+        profiler.count("deaths", deaths.sum())
+
+    #evaluate fitness of the individual
+    return network.alive_matrix().reshape(_TESTS_PER_INDIVIDUAL, copies, _N_NODES).sum(axis=2)
+
 
 class Evolution:
-    def __init__(self, population_size, n_nodes, total_connections):
+    def __init__(self, population_size, n_nodes, total_connections, evaluator=None, seeding=None):
         self.individuals = []
+        self.seeding = seeding or Seeding() #every random draw comes from a stream of the master seed (see seeding.py)
         self.n_nodes = n_nodes
         self.pop_size = population_size
-        self.noise = []
-
-        #initialize the log file
-        self.log_file = open(_LOG_FILE, 'a')
-        t0 = datetime.datetime.now()
-        self.log_file.write("--------------------------- " + str(t0) + " -----------------------------" + "\n")
-        self.log_file.close()
+        self.generation = 0
+        #random initial values of the networks, the same in every test of every generation
+        self.noise = NoiseBank(_TESTS_PER_INDIVIDUAL, 1, n_nodes, 0, _NODE_VALUES_RANGE, self.seeding.integer("noise"))
+        #the population is evaluated by a fixed amount of workers, see evaluator.py
+        self.evaluator = evaluator or make_evaluator("thread", evaluate_genome)
+
+        self.checkpoints = CheckpointWriter(_CHECKPOINT_FILE) #written in background
+        self.timer = PhaseTimer() #wall time of the phases of each generation
+        self.metrics = MetricsWriter(_METRICS_FILE, {"script": "phase2_thread", "population": population_size, "nodes": n_nodes,
+                                                     "connections": total_connections, "tests": _TESTS_PER_INDIVIDUAL, "seed": self.seeding.seed})
+        self.tests_run = 0 #tests run in the current generation
+        self.profile = {"phases": {}, "counters": {}} #profile of the whole run, with --profile (see profiler.py)
 
         #each individual is represented by an array, of size |total_connections|, with the 'address' of its connections in the connections_matrix
         self.genome_size = total_connections
@@ -50,65 +151,37 @@ class Evolution:
         #(i.e: When connections_matrix[i][j] == 1, there is a connection between nodes i and j)
         #To save space, as [i][j] == [j][i] (the graph isn't directional) and i != j (no self connections),
         # we will just store the triangular part of the matrix, above the main diagonal, in an array.
-        self.matrix_size = int(((n_nodes - 1)*n_nodes)/2) #this is the size of the triangular region lower to the main diagonal of the matrix.
+        self.matrix_size = genome_codec.matrix_size(n_nodes) #this is the size of the triangular region lower to the main diagonal of the matrix.
 
         #generate individuals as samples of |genome_size| from the possible connections_matrix slots.
+        population_random = random.Random(self.seeding.integer("population"))
         for i in range(population_size):
-            connections = random.sample(range(self.matrix_size), self.genome_size) #get a genome_size sample in a matrix_size range
+            connections = population_random.sample(range(self.matrix_size), self.genome_size) #get a genome_size sample in a matrix_size range
             self.individuals.append([connections,0.0]) #add individual and fitness to individual array
 
-    def run(self):
+    def run(self, generation):
+        self.generation = generation
 
-        #generate random noise to be inputed in all networks tested in this generation
-        for i in range(_TESTS_PER_INDIVIDUAL):
-            self.noise.append(NoiseControl.random_noise_generator(self.n_nodes, _NODE_VALUES_RANGE))
-
-        threads = []
-        for i in range(self.pop_size):
-            t = threading.Thread(target=self.run_individual, args=(i,))
-            t.start()
-            threads.append(t)
-
-        for i in range(self.pop_size):
-            threads[i].join() #wait for all threads to finish
+        with self.timer.phase("evaluate"):
+            fitness, tests = self.evaluator.map([individual[0] for individual in self.individuals], (self.noise,))
+        for individual, individual_fitness in zip(self.individuals, fitness.tolist()):
+            individual[1] = individual_fitness
+        self.tests_run = int(tests.sum())
 
         #order individuals by fitness
         self.individuals.sort(key = lambda x: x[1]) #Sort the sample by fitness
 
-    def run_individual(self, num):
-        print(">>starting thread ", num)
-
-        #generate connections_matrix, from the genome
-        connections_matrix = [0] * self.matrix_size #initialize with zeroes 
-        for connection in self.individuals[num][0]:
-            connections_matrix[connection] = 1 #replace to 1, the edges indicated in the genome
+        #save the evaluated population
+        with self.timer.phase("checkpoint"):
+            self.checkpoints.save(generation, [individual[0] for individual in self.individuals], [individual[1] for individual in self.individuals],
+                                  {"seeding": self.seeding.state()})
 
-        partial_fitness = 0
-
-        for j in range(_TESTS_PER_INDIVIDUAL):
-            #generate network from genome 
-            network = Network(self.n_nodes)
-            network.initialize_from_matrix(connections_matrix)
-
-            #initialize network with values
-            NoiseControl.apply_random_noise(network, self.noise[j])
-
-            #run for certain time
-            for k in range(_ITERATIONS):
-                #[input energy]
-                #NoiseControl.apply_random_noise(network, noise_range=_MAX_ENERGY_INPUT)
-                #run network
-                network.run(_LOWER_ENERGY_LIMIT_RULE, _UPPER_ENERGY_LIMIT_RULE)
-                #update network
-                network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
-                #[lose energy]
-
-            #evaluate fitness of the individual
-            partial_fitness += network.count_survivors()
-        #network.print_network(True)
-        fitness = partial_fitness / float(_TESTS_PER_INDIVIDUAL)
-        self.individuals[num][1] = fitness
-        print("<<closing thread ", num)
+    def close(self):
+        #stop the workers, free the noise, and wait for the last checkpoint and metrics to be written
+        self.evaluator.close()
+        self.noise.release()
+        self.metrics.close()
+        self.checkpoints.close() #last: raises if a checkpoint couldn't be written
 
 
     def evolute(self):
@@ -118,84 +191,66 @@ class Evolution:
         for i in range(_PARENTS_SELECTED):
             new_generation.append([self.individuals[self.pop_size-1-i][0], 0])
 
-        #create the rest as combination of two parents
-        for i in range(self.pop_size - _PARENTS_SELECTED):
-            #select parents to reproduce
-            father = self.select(_SELECTION_SAMPLE_SIZE)
-            mother = self.select(_SELECTION_SAMPLE_SIZE)
-            #generate new individuals
-            child = self.sex(father, mother, _MUTATION_RATE)
-            new_generation.append([child, 0])
+        #create the rest as combination of two parents: tournament selection, crossover and mutation, all at once (see genetic_operators.py)
+        #the mutation replaces a gene by any other edge of the matrix
+        population = [individual[0] for individual in self.individuals]
+        fitness = [individual[1] for individual in self.individuals]
+        with self.timer.phase("breed"):
+            rng = self.seeding.rng("breeding", self.generation)
+            children = genetic_operators.breed(population, fitness, self.pop_size - _PARENTS_SELECTED, _SELECTION_SAMPLE_SIZE, _MUTATION_RATE, self.n_nodes, rng, keep_node=False)
+        for child in children:
+            new_generation.append([child.tolist(), 0])
 
         self.individuals = new_generation #Exchange old individuals with the new generation
 
 
-    def select(self, sample_size):
-        sample = random.sample(self.individuals, sample_size) #get a sample, to select the parent
-        sample.sort(key = lambda x: x[1]) #Sort the sample by fitness
-        return sample[sample_size - 1][0] #Return phenotype of the best individual
-
-    def sex(self, father, mother, mutation_rate):
-        #1-crossover
-
-        #put the parents genes in a bag, removing duplicates
-        bag = list(set(father+mother))
-        #the child will be a sample from this bag
-        child = random.sample(bag, self.genome_size)
-
-        #2-mutation
-        for i in range(len(child)): #There is a mutation_rate of being changed for each gene of the phenotype
-            if random.random() < mutation_rate:
-                new_gene = random.randrange(self.genome_size) #choose a new gene randomly #TODO: choose only from neighbours
-                while(new_gene in child): #it need to be unique
-                    new_gene = random.randrange(self.genome_size)
-                child[i] = new_gene
-
-        return child
-
     def print_results(self, generation):
-        #print best result, avg result, median, worst and the phenotype (represented in hexadecimal) of the best result
-        best = self.individuals[self.pop_size-1][1] #self.individuals list was sorted in beggining of evolution method
-        median = self.individuals[round(self.pop_size/2)][1]
-        worst = self.individuals[0][1]
-        fitness_sum = sum([fit[1] for fit in  self.individuals])
-        avg = fitness_sum/float(self.pop_size)
-
-        best_phenotype = self.individuals[self.pop_size-1][0].copy()
-        best_phenotype.sort()
+        #print best result, avg result, median and worst, and add the record of the generation to the metrics (the genomes are in the checkpoints)
+        fitness = [individual[1] for individual in self.individuals]
+        record = dict(generation=generation, **fitness_summary(fitness))
+        record.update(diversity=diversity([individual[0] for individual in self.individuals]), evaluations=self.pop_size,
+                      tests=self.tests_run, phases=self.timer.reset())
+        profile = profiler.take() #simulation phases and counters of every worker, with --profile
+        if profile is not None:
+            record["profile"] = profile
+            profiler.merge(profile, self.profile)
 
         #print in the output
         print("generation:", generation)
-        print("Best =", best, "avg =", avg, "median=", median, "worst =", worst)
-        print("Best phenotype:")
-        print(best_phenotype)
-
-        #print in file
-        self.log_file = open(_LOG_FILE, 'a') #open and close file every print, to save broken executions
+        print("Best =", record["best"], "avg =", record["avg"], "median=", record["median"], "worst =", record["worst"])
 
-        self.log_file.write("generation: " + str(generation) + "\n")
-        self.log_file.write("Best = " + str(best) + " avg = " + str(avg) + " median= " + str(median) + " worst = " + str(worst) + "\n")
-        self.log_file.write("Best phenotype:" + "\n")
-        self.log_file.write(str(best_phenotype) + "\n")
+        #print in file (buffered, see metrics.py)
+        self.metrics.write(record)
 
-        self.log_file.close()
 
+def main(argv):
+    parser = argparse.ArgumentParser(description="Evolution of the network topology")
+    add_backend_arguments(parser, default="thread")
+    add_profile_argument(parser)
+    add_seed_argument(parser)
+    args = parser.parse_args(argv[1:])
+    profiler.enable(args.profile) #before the workers are started
 
-def main():
     #evolution of the network
     #generate initial population P
-    evolution = Evolution(_POPULATION_SIZE, _N_NODES, _TOTAL_CONNECTIONS)
+    evaluator = make_evaluator(args.backend, evaluate_genome, evaluate_genomes, args.workers, args.batch_size)
+    evolution = Evolution(_POPULATION_SIZE, _N_NODES, _TOTAL_CONNECTIONS, evaluator, Seeding(args.seed))
+    print("seed:", evolution.seeding.seed)
     for i in range(_GENERATIONS):
         print(">>>>>>GENERATION", i)
         #run program
-        evolution.run()
+        evolution.run(i)
         evolution.print_results(i)
         #evolve
         evolution.evolute()
+    evolution.close()
     print(">>>>>>FINAL RESULT:")
     for i in range(len(evolution.individuals)):
             print(evolution.individuals[i][0])
+    if profiler.enabled():
+        print(">>>>>>PROFILE:")
+        print(profiler.summary(evolution.profile))
 
 if __name__ == "__main__":
-    main()
+    main(sys.argv)
 
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Opt-in timers and counters of the simulation hot paths.
+
+Enabled by the --profile option of the evolution scripts (see
+add_profile_argument) or by the PLANTS_PROFILE environment variable. When
+disabled, phase() returns a shared do-nothing context and count() returns at
+once, so the instrumented code costs about the same as without them.
+
+    with profiler.phase("run"):
+        transfers = network.run(lower, upper)
+    profiler.count("transfers", transfers)
+
+Each thread adds to its own profile: a dict of phase name -> [seconds, calls]
+and counter name -> total. take() returns the profile of the calling thread and
+starts a new one; pool workers send theirs back with their results, and the
+caller merges them into its own (see evaluator.py and pool_map), so the
+profile of the driver covers every worker.
+"""
+
+import os
+import time
+import threading
+import contextlib
+
+
+_ENVIRONMENT_VARIABLE = "PLANTS_PROFILE"
+
+_enabled = os.environ.get(_ENVIRONMENT_VARIABLE, "") not in ("", "0")
+_local = threading.local()
+_NO_PHASE = contextlib.nullcontext()
+
+
+def enabled():
+    return _enabled
+
+
+def enable(on=True):
+    #turn the profiling on (or off); the environment variable is set too, so new worker processes follow
+    global _enabled
+    _enabled = on
+    os.environ[_ENVIRONMENT_VARIABLE] = "1" if on else "0"
+
+
+def _profile():
+    profile = getattr(_local, "profile", None)
+    if profile is None:
+        profile = _local.profile = {"phases": {}, "counters": {}}
+    return profile
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception):
+        add_time(self.name, time.perf_counter() - self.start)
+
+
+def phase(name):
+    #context that adds its wall time to the phase name
+    return _Phase(name) if _enabled else _NO_PHASE
+
+
+def add_time(name, seconds):
+    #add a call of the phase name, measured elsewhere
+    if _enabled:
+        phases = _profile()["phases"]
+        timer = phases.get(name)
+        if timer is None:
+            phases[name] = [seconds, 1]
+        else:
+            timer[0] += seconds
+            timer[1] += 1
+
+
+def count(name, amount=1):
+    #add amount to the counter name
+    if _enabled:
+        counters = _profile()["counters"]
+        counters[name] = counters.get(name, 0) + int(amount)
+
+
+def take():
+    #profile of this thread since the last take() (None when disabled)
+    if not _enabled:
+        return None
+    profile = _profile()
+    _local.profile = None
+    return profile
+
+
+def merge(profile, into=None):
+    #add the phases and counters of profile to into (by default, to the profile of this thread); returns into
+    if into is None:
+        into = _profile()
+    if profile:
+        for name, (seconds, calls) in profile["phases"].items():
+            timer = into["phases"].setdefault(name, [0.0, 0])
+            timer[0] += seconds
+            timer[1] += calls
+        for name, amount in profile["counters"].items():
+            into["counters"][name] = into["counters"].get(name, 0) + amount
+    return into
+
+
+def _profiled_call(task):
+    #worker side of pool_map: the result, and the profile of the call
+    func, args = task
+    result = func(args)
+    return result, take()
+
+
+def pool_map(pool, func, iterable):
+    #pool.map(func, iterable), adding the profile of the workers to the profile of this thread when enabled
+    if not _enabled:
+        return pool.map(func, iterable)
+    results = []
+    for result, profile in pool.map(_profiled_call, [(func, args) for args in iterable]):
+        merge(profile)
+        results.append(result)
+    return results
+
+
+def summary(profile):
+    #table of the phases (sorted by time) and of the counters
+    lines = ["%-16s %10s %12s %12s" % ("phase", "calls", "seconds", "us/call")]
+    phases = sorted(profile["phases"].items(), key=lambda item: -item[1][0]) if profile else []
+    for name, (seconds, calls) in phases:
+        lines.append("%-16s %10d %12.3f %12.1f" % (name, calls, seconds, 1e6 * seconds / max(calls, 1)))
+    lines.append("%-16s %10s" % ("counter", "total"))
+    for name, amount in sorted(profile["counters"].items()) if profile else []:
+        lines.append("%-16s %10d" % (name, amount))
+    return "\n".join(lines)
+
+
+def add_profile_argument(parser):
+    #--profile option of the evolution scripts (see enable)
+    parser.add_argument("--profile", action="store_true", default=_enabled,
+                        help="time the phases of the simulation and count its events (or set " + _ENVIRONMENT_VARIABLE + "=1)")
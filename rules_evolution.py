@@ -3,21 +3,39 @@
 
 import sys, os
 import random
+import numpy as np
 import datetime
 import threading
 import pickle
 from network import *
+from array_network import Topology
+from noise_bank import NoiseBank
+from topology_bank import TopologyBank
+from checkpoint import latest_checkpoint
+from metrics import MetricsWriter, PhaseTimer, fitness_summary
+import profiler
+from profiler import add_profile_argument
+import argparse
+from seeding import Seeding, add_seed_argument
 from multiprocessing import Pool
 
 #evolution constrains
 _TESTS_PER_INDIVIDUAL = 50      #amount of tests by individual
 _RESULT_FILE = "rules/result_" #dat"
+_METRICS_FILE = "logs/rules.jsonl" #one record per search step (see metrics.py)
 _ITERATIONS = 100                 #how many iterations each individual will try to survive
 _LOWER_ENERGY_LIMIT_DANGER = 40   #absolute lower limit. If the node stay bellow this level for G generations, it dies
 _UPPER_ENERGY_LIMIT_DANGER = 60   #absolute upper limit. If the node stay above this level for G generations, it dies
 _GENERATIONS_IN_DANGER_LIMIT = 3  #maximum # of generations the node can stay in danger level
 _MAX_ENERGY_INPUT = 10            #maximum amount of energy inputed to the system during execution
 _NOISE_DURING = False             #apply (or not) noise during execution
+_ENGINE = "array"                 #simulation engine: "object" (Network, list of Node objects) or "array" (ArrayNetwork, NumPy arrays)
+_SEARCH = "adaptive"              #"grid": test every (lower, upper) pair; "adaptive": coarse grid of the feasible pairs, then refined around the best ones
+_COARSE_STEP = 10                 #distance between the candidates of the coarse grid (halved at each refinement, down to 1)
+_REFINE_KEEP = 5                  #best candidates around which each refinement looks
+_TOPOLOGY_BANK = True             #generate the network of each test once, and test every candidate on the same networks (see topology_bank.py)
+_SWEEP = True                     #with the array engine, run many candidates at once (one row of an EnsembleNetwork each) on the same network and noise
+_SWEEP_BATCH = 250                #candidates run together by each task of the sweep
 
 #network constrains
 _NODE_VALUES_RANGE = 100          #range of network's nodes value
@@ -33,12 +51,11 @@ _M = 2                            #number of added connections per iteration in
 _LIN_SIZE = 40                    #dimensions of von-neumann grid 
 _COL_SIZE = 25                    #WARNING: _LIN_SIZE * _COL_SIZE must be equal _N_NODES
 
-random.seed()
-
 def get_genome_from_file(filename):
-    pickle_file = open(filename, "rb")
-    genome_population = pickle.load(pickle_file)
-    genome = genome_population[-1][0] #get the last genome, to test. if the list is initialized, it will contain the best individual
+    #best genome of the last generation saved by phase2_evolution.py (see checkpoint.py)
+    checkpoint = latest_checkpoint(filename)
+    genome = checkpoint.genomes[-1].tolist() #the checkpoints are sorted by fitness: the last one is the best individual
+    return genome
 
 def create_my_network(args):
     #create network from file resulting of the evolution
@@ -68,13 +85,20 @@ def create_random(args):
 def create_scale_free(args):
     return ScaleFreeNetwork(args[0], args[1], args[2]) #n_nodes, m_zero, m (m < m_zero)
 
-def run_test(candidates, create_net_func, func_args, init_noise=[]):
+def run_test(candidates, create_net_func, func_args, init_noise=[], pool=None, topologies=None, seeding=None):
     ##run execution in paralel
-    pool = Pool()
-    map_args = [[candidates[i], create_net_func, func_args, init_noise] for i in range(_NODE_VALUES_RANGE**2)]
+    #seeding: streams of the generated networks (see seeding.py), when there is no TopologyBank
+    if pool is None:
+        pool = Pool()
+    if _SWEEP and _ENGINE == "array":
+        candidates = run_sweep(candidates, create_net_func, func_args, init_noise, pool, topologies, seeding)
+        candidates.sort(key = lambda x: x[2]) #Sort the sample by fitness
+        return candidates
+
+    map_args = [[candidates[i], create_net_func, func_args, init_noise, topologies, seeding] for i in range(len(candidates))]
     
     #paralel:
-    candidates = pool.map(iteration, map_args)
+    candidates = profiler.pool_map(pool, iteration, map_args)
 
     #linear (old):
     #candidates = []
@@ -86,41 +110,169 @@ def run_test(candidates, create_net_func, func_args, init_noise=[]):
     return candidates
 
 
+def run_sweep(candidates, create_net_func, func_args, init_noise, pool, topologies=None, seeding=None):
+    #same fitness as iteration, but each task runs a batch of candidates on one test (see sweep)
+    bank = topologies if topologies is not None else TopologyBank(create_net_func, func_args, _TESTS_PER_INDIVIDUAL, seeding)
+    limits = np.array([[candidate[0], candidate[1]] for candidate in candidates], dtype=np.float64).reshape(-1, 2)
+    batches = range(0, len(candidates), _SWEEP_BATCH)
+    tasks = [(first, j) for j in range(_TESTS_PER_INDIVIDUAL) for first in batches]
+    map_args = [[limits[first:first + _SWEEP_BATCH], bank, init_noise, j] for first, j in tasks]
+
+    survivors = np.zeros((len(candidates), _TESTS_PER_INDIVIDUAL), dtype=np.int64)
+    for (first, j), batch_survivors in zip(tasks, profiler.pool_map(pool, sweep, map_args)):
+        survivors[first:first + len(batch_survivors), j] = batch_survivors
+    if topologies is None:
+        bank.release()
+
+    fitness = survivors.sum(axis=1) / float(_TESTS_PER_INDIVIDUAL)
+    candidates = [[candidate[0], candidate[1], candidate_fitness] for candidate, candidate_fitness in zip(candidates, fitness.tolist())]
+    for candidate in candidates:
+        print(candidate[0], candidate[1], candidate[2])
+    return candidates
+
+
+def sweep(args):
+    #iteration of a batch of candidates, for the test j only: each candidate is one row of an EnsembleNetwork, all of
+    #them on the same network and noise; returns the survivors of each candidate
+    limits = args[0]
+    topologies = args[1]
+    init_noise = args[2]
+    j = args[3]
+
+    profiler.count("trials", len(limits))
+    with profiler.phase("build"):
+        network = topologies[j].fresh_ensemble(len(limits))
+    #initialize network with values
+    with profiler.phase("noise"):
+        if not _NOISE_DURING:
+            NoiseControl.apply_random_noise(network, init_noise[j, 0])
+        else:
+            NoiseControl.apply_regular_noise(network, (_LOWER_ENERGY_LIMIT_DANGER+_UPPER_ENERGY_LIMIT_DANGER)/2)
+
+    #run for certain time
+    for k in range(_ITERATIONS):
+        #[input energy]
+        if(_NOISE_DURING):
+            with profiler.phase("noise"):
+                NoiseControl.apply_random_noise(network, init_noise[j, k])
+        #run network, each row with the rule of its candidate
+        with profiler.phase("run"):
+            rules = limits[network.trials]
+            transfers = network.run(rules[:, :1], rules[:, 1:])
+        profiler.count("transfers", transfers.sum())
+        #update network
+        with profiler.phase("update"):
+            deaths = network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+        profiler.count("deaths", deaths.sum())
+        #stop the candidates where nothing can change anymore (see iteration)
+        with profiler.phase("convergence"):
+            over = network.count_alive() == 0
+            if not _NOISE_DURING:
+                over |= (transfers == 0) & (network.endangered == 0)
+            network.retire(over)
+        if k < _ITERATIONS - 1:
+            profiler.count("early_exits", np.count_nonzero(over))
+        if len(network.trials) == 0:
+            break
+
+    return network.count_survivors()
+
+
+def write_metrics(metrics, timer, create_net_func, step, candidates):
+    #record of the candidates tested in a step of the search (see metrics.py)
+    if metrics is not None:
+        fitness = [candidate[2] for candidate in candidates]
+        metrics.write(dict(test=create_net_func.__name__, step=step, **fitness_summary(fitness), evaluations=len(candidates), phases=timer.reset()))
+
+
+def adaptive_search(create_net_func, func_args, init_noise=[], pool=None, topologies=None, metrics=None, timer=None, seeding=None):
+    #coarse to fine search of the best rules: instead of testing every pair, test a coarse grid of the feasible
+    #pairs (lower <= upper), then a grid twice as fine around the _REFINE_KEEP best candidates found so far, until
+    #the step is 1. Returns every tested candidate, sorted by fitness (as run_test)
+    #metrics: MetricsWriter that receives a record per step, with the times measured by timer
+    timer = timer or PhaseTimer()
+    step = _COARSE_STEP
+    grid = range(0, _NODE_VALUES_RANGE, step)
+    new_candidates = [[i, j, 0] for i in grid for j in grid if i <= j]
+    tested = {}
+    while new_candidates:
+        print(">>>>> step", step, ":", len(new_candidates), "candidates")
+        with timer.phase("run"):
+            results = run_test(new_candidates, create_net_func, func_args, init_noise, pool, topologies, seeding)
+        for candidate in results:
+            tested[(candidate[0], candidate[1])] = candidate
+        write_metrics(metrics, timer, create_net_func, step, results)
+        if step == 1:
+            break
+
+        #refine: look between the best candidates and their neighbours in the current grid
+        best = sorted(tested.values(), key = lambda x: x[2])[-_REFINE_KEEP:]
+        radius = step
+        step = max(step // 2, 1)
+        new_candidates = []
+        for candidate in best:
+            lines = range(max(candidate[0] - radius, 0), min(candidate[0] + radius, _NODE_VALUES_RANGE - 1) + 1, step)
+            columns = range(max(candidate[1] - radius, 0), min(candidate[1] + radius, _NODE_VALUES_RANGE - 1) + 1, step)
+            for i in lines:
+                for j in columns:
+                    if i <= j and (i, j) not in tested:
+                        tested[(i, j)] = None #reserved, to test it only once
+                        new_candidates.append([i, j, 0])
+
+    candidates = [candidate for candidate in tested.values() if candidate is not None]
+    candidates.sort(key = lambda x: x[2]) #Sort the sample by fitness
+    return candidates
+
+
 def iteration(args):
     candidate = args[0]
     create_net_func = args[1]
     func_args = args[2]
     init_noise = args[3]
+    topologies = args[4] if len(args) > 4 else None #TopologyBank with the network of each test, or None to generate new ones
+    seeding = args[5] if len(args) > 5 else None #streams of the generated networks (see seeding.py)
 
     partial_fitness = 0
 
+    profiler.count("trials", _TESTS_PER_INDIVIDUAL)
     for j in range(_TESTS_PER_INDIVIDUAL):
-        network = create_net_func(func_args)
+        with profiler.phase("build"):
+            if topologies is not None:
+                network = topologies[j].fresh_state() if _ENGINE == "array" else topologies[j].to_network()
+            else:
+                if seeding is not None: #the network of each candidate and test only depends on the master seed
+                    random.seed(seeding.integer(candidate[0], candidate[1], j))
+                network = create_net_func(func_args)
+                if _ENGINE == "array":
+                    network = Topology.from_network(network).fresh_state() #compiled once per generated network
         #initialize network with values
-        if not _NOISE_DURING:
-            NoiseControl.apply_random_noise(network, init_noise[j])
-        else:
-            NoiseControl.apply_regular_noise(network, (_LOWER_ENERGY_LIMIT_DANGER+_UPPER_ENERGY_LIMIT_DANGER)/2)
+        with profiler.phase("noise"):
+            if not _NOISE_DURING:
+                NoiseControl.apply_random_noise(network, init_noise[j, 0])
+            else:
+                NoiseControl.apply_regular_noise(network, (_LOWER_ENERGY_LIMIT_DANGER+_UPPER_ENERGY_LIMIT_DANGER)/2)
 
-        old_values_list = network.get_values()
-        similar_runs = 0
+        survivors = network.count_survivors()
         #run for certain time
         for k in range(_ITERATIONS):
             #[input energy]
             if(_NOISE_DURING):
-                NoiseControl.apply_random_noise(network, noise_range=_MAX_ENERGY_INPUT, negative_range=True) #TODO: dont randomize every time
+                with profiler.phase("noise"):
+                    NoiseControl.apply_random_noise(network, init_noise[j, k])
             #run network
-            network.run(candidate[0], candidate[1]) #test candidates rule
+            with profiler.phase("run"):
+                transfers = network.run(candidate[0], candidate[1]) #test candidates rule
+            profiler.count("transfers", transfers)
             #update network
-            network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
-            new_values_list = network.get_values()
-            if new_values_list == old_values_list: #check if there was really an update. if not, you don't need more iterations
-                similar_runs += 1
-            else:
-                similar_runs = 0
-            if similar_runs == 3:
+            with profiler.phase("update"):
+                deaths = network.update_network(_LOWER_ENERGY_LIMIT_DANGER, _UPPER_ENERGY_LIMIT_DANGER, _GENERATIONS_IN_DANGER_LIMIT)
+            profiler.count("deaths", deaths)
+            survivors -= deaths
+            #stop when nothing can change anymore: every node is dead, or (without energy input) no transfer happened and no live node is on its way to die
+            if survivors == 0 or (transfers == 0 and network.endangered == 0 and not _NOISE_DURING):
+                if k < _ITERATIONS - 1:
+                    profiler.count("early_exits")
                 break
-            old_values_list = new_values_list #update list os values for next iteration
 
         #evaluate fitness of the individual
         partial_fitness += network.count_survivors()
@@ -132,9 +284,17 @@ def iteration(args):
     return candidate
 
 def main(argv):
-    if len(argv) == 3:
-        #usage: rules_evolution [n_nodes] [pickle_file]
-        genome = get_genome_from_file(argv[1], argv[2])
+    parser = argparse.ArgumentParser(description="Search of the best rules (lower and upper energy limits) of each topology")
+    parser.add_argument("files", nargs="*", help="n_nodes checkpoint_file: test the best genome of an evolution")
+    add_profile_argument(parser)
+    add_seed_argument(parser)
+    args = parser.parse_args(argv[1:])
+    profiler.enable(args.profile)
+    seeding = Seeding(args.seed) #every random draw comes from a stream of the master seed (see seeding.py)
+    print("seed:", seeding.seed)
+    if len(args.files) == 2:
+        #usage: rules_evolution [n_nodes] [checkpoint_file]
+        genome = get_genome_from_file(args.files[1])
 
 
     ########create the candidates
@@ -146,13 +306,13 @@ def main(argv):
             candidates.append([i,j,0])
 
     ########create noise
+    #generated once, in shared memory, and read by every candidate (see noise_bank.py)
     if not _NOISE_DURING:
-        #generate random noise to be inputed in all networks tested
-        noise = []
-        for i in range(_TESTS_PER_INDIVIDUAL):
-            noise.append(NoiseControl.random_noise_generator(_N_NODES, _NODE_VALUES_RANGE))
+        #random initial values of all networks tested
+        noise = NoiseBank(_TESTS_PER_INDIVIDUAL, 1, _N_NODES, 0, _NODE_VALUES_RANGE, seeding.integer("noise"))
     else:
-        noise = []
+        #random input of energy at each iteration
+        noise = NoiseBank(_TESTS_PER_INDIVIDUAL, _ITERATIONS, _N_NODES, -_MAX_ENERGY_INPUT, _MAX_ENERGY_INPUT, seeding.integer("noise"))
 
     ########run tests
     test_params = [
@@ -166,13 +326,40 @@ def main(argv):
     ]
 
     results = []
+    pool = Pool()
+    metrics = MetricsWriter(_METRICS_FILE, {"script": "rules_evolution", "search": _SEARCH, "engine": _ENGINE, "nodes": _N_NODES,
+                                            "tests": _TESTS_PER_INDIVIDUAL, "noise_during": _NOISE_DURING, "seed": seeding.seed})
+    timer = PhaseTimer()
+    profile = {"phases": {}, "counters": {}} #profile of the whole run, with --profile
     for i in range(len(test_params)):
         print(">>>>>>>>>> TEST", i)
-        results = run_test(test_params[i][0], test_params[i][1], test_params[i][2], test_params[i][3])
+        topologies = None
+        if _TOPOLOGY_BANK:
+            with timer.phase("topologies"):
+                topologies = TopologyBank(test_params[i][1], test_params[i][2], _TESTS_PER_INDIVIDUAL, seeding.child("network", i))
+        if _SEARCH == "adaptive":
+            results = adaptive_search(test_params[i][1], test_params[i][2], test_params[i][3], pool, topologies, metrics, timer, seeding.child("network", i))
+        else:
+            with timer.phase("run"):
+                results = run_test(test_params[i][0], test_params[i][1], test_params[i][2], test_params[i][3], pool, topologies, seeding.child("network", i))
+            write_metrics(metrics, timer, test_params[i][1], None, results)
+        if topologies is not None:
+            topologies.release()
+        test_profile = profiler.take() #simulation phases and counters of every worker of this test
+        if test_profile is not None:
+            metrics.write({"test": test_params[i][1].__name__, "profile": test_profile})
+            profiler.merge(test_profile, profile)
         #copy candidates population to a file
         result_file = open(_RESULT_FILE+test_params[i][1].__name__+".dat", "wb")
         pickle.dump(results, result_file)
         result_file.close()
+    pool.close()
+    pool.join()
+    noise.release()
+    metrics.close()
+    if profiler.enabled():
+        print(">>>>>>>>>> PROFILE:")
+        print(profiler.summary(profile))
 
 
 
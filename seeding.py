@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Reproducible random streams, all derived from one master seed.
+
+Every random draw of a run comes from a stream named by what it is for, e.g.
+seeding.rng("noise", generation) or seeding.rng("trial", generation, genome, test):
+a NumPy SeedSequence of the master seed, with the name and the numbers as its
+spawn key. Streams with different keys are independent, and a stream only
+depends on its key, never on the order it is asked for, or on the process
+asking: a worker can derive the stream of the individual or test it runs, so
+the results are the same whatever the amount of workers or the chunking.
+
+    seeding = Seeding(42)          #or Seeding() for a new master seed
+    rng = seeding.rng("breeding", generation)
+    noise = NoiseBank(..., seeding.integer("noise", generation))
+    trials = seeding.child("trial", generation)   #a Seeding, to derive the streams of the tests of a generation
+
+The master seed is all that is needed to repeat a run: it is printed, saved
+with the metrics and in the checkpoints (see state() and from_state()).
+"""
+
+import hashlib
+import numpy as np
+
+
+#names of the streams (the first number of their spawn keys)
+_STREAMS = {"population": 0, "noise": 1, "breeding": 2, "trial": 3, "network": 4, "worker": 5, "island": 6}
+
+
+def _key(names):
+    #spawn key of a stream: the numbers of its names, and its numbers as they are
+    return tuple(_STREAMS[name] if isinstance(name, str) else int(name) for name in names)
+
+
+def genome_key(genome):
+    #number that identifies a genome, whatever the order of its genes (to key the streams of an individual)
+    genes = np.sort(np.asarray(genome, dtype=np.int64))
+    return int.from_bytes(hashlib.blake2b(genes.tobytes(), digest_size=8).digest(), "little")
+
+
+class Seeding:
+    """Source of the random streams of a run (see the module documentation)
+        Parameters: seed (master seed; None for a new one), key (spawn key of this source, used by child)"""
+    def __init__(self, seed=None, key=()):
+        self.seed = int(np.random.SeedSequence().entropy) if seed is None else int(seed)
+        self.key = tuple(key)
+
+    def sequence(self, *names):
+        return np.random.SeedSequence(self.seed, spawn_key=self.key + _key(names))
+
+    def rng(self, *names):
+        #NumPy generator of the stream
+        return np.random.default_rng(self.sequence(*names))
+
+    def integer(self, *names):
+        #64-bit seed of the stream, for the code that takes a seed number (NoiseBank, random.seed)
+        return int(self.sequence(*names).generate_state(1, np.uint64)[0])
+
+    def child(self, *names):
+        #source of the streams under the stream names (child("trial", 3).rng(7) is rng("trial", 3, 7))
+        return Seeding(self.seed, self.key + _key(names))
+
+    def state(self):
+        #what a checkpoint needs to derive the same streams again
+        return {"seed": self.seed, "key": list(self.key)}
+
+    @staticmethod
+    def from_state(state):
+        return Seeding(state["seed"], state["key"])
+
+
+def add_seed_argument(parser):
+    #--seed option of the evolution scripts
+    parser.add_argument("--seed", type=int, default=None, help="master seed of the random streams, to repeat a run (default: a new one, printed)")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""NumPy arrays in shared memory, to hand big read-only data to pool workers without copying it."""
+
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+
+def _attach(name):
+    #map an existing block without tracking it: only its owner unlinks it
+    #(otherwise the resource tracker of a worker would unlink the block, or warn about it, when the worker exits)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) #python >= 3.13
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+class SharedArray:
+    """NumPy array stored in a multiprocessing.shared_memory block.
+        It is pickled as the name of the block, so a worker that receives it maps the same memory instead of a copy.
+        Only the process that created it (the owner) should release() it.
+        Parameters: shape, dtype, name (of an existing block, to attach to it; None creates a new block)"""
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = _attach(name)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.shm.buf)
+
+    def __reduce__(self):
+        return (SharedArray, (self.shape, self.dtype.str, self.shm.name))
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __setitem__(self, index, value):
+        self.array[index] = value
+
+    def __len__(self):
+        return self.shape[0]
+
+    def release(self):
+        #free the shared memory (the array can't be used anymore)
+        self.array = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Surrogate model of the fitness, to pre-screen the children before their simulation.
+
+A child costs _TESTS_PER_INDIVIDUAL simulations, but its structure costs almost nothing to measure: the features
+of its network (histogram and variance of the degrees, connected components, clustering) are scored by a ridge
+regression trained online on every simulated individual. With Evolution(surrogate=Surrogate(...)),
+evolute() breeds 1/fraction times more children than it needs and only the ones with the best predicted fitness
+are simulated (until the model has seen min_samples individuals, every child is simulated, as without it).
+
+    surrogate = Surrogate(n_nodes, fraction=0.5)
+    kept = surrogate.screen(children, n_children)   #indices of the most promising children
+    record = surrogate.learn(genomes, fitness)      #train on the simulated genomes; spearman: rank correlation of their predictions
+
+The model keeps the sums of the products of the features and fitness (faded by decay at each generation, as
+the noise and the population change), not the individuals, and is solved again (a features x features system)
+after each generation.
+"""
+
+import math
+import numpy as np
+import genome_codec
+
+
+_MAX_DEGREE = 8                  #last bin of the degree histogram (degree _MAX_DEGREE or more)
+_ALPHA = 0.1                     #ridge penalty, on the standardized features
+_DECAY = 0.9                     #weight kept by the older individuals at each generation
+_MIN_SAMPLES = 50                #simulated individuals before the model screens children
+
+FEATURES = ["degree_%d" % degree for degree in range(_MAX_DEGREE)] + ["degree_%d+" % _MAX_DEGREE,
+            "degree_variance", "max_degree", "components", "largest_component", "clustering"]
+
+
+def features(genome, n_nodes):
+    #structural features of the network of the genome (see FEATURES): fraction of the nodes with each degree, variance and
+    #maximum of the degrees, components (over the nodes), nodes in the largest component (fraction) and average clustering
+    line, column = genome_codec.decode(genome)
+    degrees = np.bincount(line, minlength=n_nodes) + np.bincount(column, minlength=n_nodes)
+    histogram = np.bincount(np.minimum(degrees, _MAX_DEGREE), minlength=_MAX_DEGREE + 1) / float(n_nodes)
+
+    #components: each node takes the smallest label of its neighbours, and jumps to the label of its label, until nothing changes
+    labels = np.arange(n_nodes)
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, line, labels[column])
+        np.minimum.at(labels, column, labels[line])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+    sizes = np.bincount(labels, minlength=n_nodes)
+
+    #clustering of a node: connections between its neighbours, over the possible ones (0 under 2 neighbours)
+    neighbours = [set() for i in range(n_nodes)]
+    for i, j in zip(line.tolist(), column.tolist()):
+        neighbours[i].add(j)
+        neighbours[j].add(i)
+    triangles = np.zeros(n_nodes) #twice the triangles of each node (each one is seen from its two edges at the node)
+    for i, j in zip(line.tolist(), column.tolist()):
+        common = len(neighbours[i] & neighbours[j])
+        triangles[i] += common
+        triangles[j] += common
+    pairs = degrees * (degrees - 1.0)
+    clustering = np.divide(triangles, pairs, out=np.zeros(n_nodes), where=pairs > 0)
+
+    return np.concatenate((histogram, [degrees.var(), degrees.max(), np.count_nonzero(sizes) / float(n_nodes),
+                                       sizes.max() / float(n_nodes), clustering.mean()]))
+
+
+def _ranks(values):
+    #ranks of the values (from 0), ties get the average of their ranks
+    values = np.asarray(values, dtype=np.float64)
+    ranks = np.empty(len(values))
+    ranks[np.argsort(values, kind="mergesort")] = np.arange(len(values))
+    unique, inverse = np.unique(values, return_inverse=True)
+    return (np.bincount(inverse, ranks) / np.bincount(inverse))[inverse]
+
+
+def spearman(x, y):
+    #rank correlation of x and y (None with fewer than 3 pairs, or when one of them is constant)
+    if len(x) < 3:
+        return None
+    x, y = _ranks(x), _ranks(y)
+    if x.std() == 0 or y.std() == 0:
+        return None
+    return float(np.corrcoef(x, y)[0, 1])
+
+
+class RidgeModel:
+    """Ridge regression trained online: update(x, y) adds samples to the (faded) sums of the products of
+        [features, fitness], fit() solves the regression on the standardized features
+        Parameters: n_features, alpha, decay"""
+    def __init__(self, n_features, alpha=_ALPHA, decay=_DECAY):
+        self.alpha = alpha
+        self.decay = decay
+        self.weight = 0.0 #faded amount of samples
+        self.samples = 0
+        self.sums = np.zeros(n_features + 1)
+        self.products = np.zeros((n_features + 1, n_features + 1))
+        self.coefficients = None
+
+    def update(self, x, y):
+        #add the samples x (samples x features) with fitness y; the previous ones lose 1 - decay of their weight
+        z = np.column_stack((np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)))
+        self.weight = self.decay * self.weight + len(z)
+        self.sums = self.decay * self.sums + z.sum(axis=0)
+        self.products = self.decay * self.products + z.T @ z
+        self.samples += len(z)
+        self.fit()
+
+    def fit(self):
+        mean = self.sums / self.weight
+        covariance = self.products / self.weight - np.outer(mean, mean)
+        scale = np.sqrt(np.maximum(np.diag(covariance)[:-1], 0))
+        scale[scale < 1e-12] = 1.0 #constant features (e.g. the mean degree) get no weight
+        correlation = covariance[:-1, :-1] / np.outer(scale, scale)
+        weights = np.linalg.solve(correlation + self.alpha * np.eye(len(scale)), covariance[:-1, -1] / scale)
+        self.coefficients = (mean[:-1], scale, weights, mean[-1])
+
+    def predict(self, x):
+        mean, scale, weights, intercept = self.coefficients
+        return ((np.asarray(x, dtype=np.float64) - mean) / scale) @ weights + intercept
+
+
+class Surrogate:
+    """Pre-screening of the children of an evolution (see the module documentation)
+        Parameters: n_nodes, fraction (of the bred children that are simulated), min_samples, alpha, decay"""
+    def __init__(self, n_nodes, fraction=0.5, min_samples=_MIN_SAMPLES, alpha=_ALPHA, decay=_DECAY):
+        self.n_nodes = n_nodes
+        self.fraction = fraction
+        self.min_samples = min_samples
+        self.model = RidgeModel(len(FEATURES), alpha, decay)
+        self.known = {} #key of a screened genome -> (features, predicted fitness), until learn
+        self.screened = 0 #children dropped by the last screen
+
+    def ready(self):
+        return self.model.samples >= self.min_samples
+
+    def bred(self, n_children):
+        #children to breed to keep n_children of them
+        return int(math.ceil(n_children / self.fraction)) if self.ready() else n_children
+
+    def screen(self, genomes, n_children):
+        #indices of the n_children genomes with the best predicted fitness (in their order)
+        x = np.array([features(genome, self.n_nodes) for genome in genomes])
+        if not self.ready():
+            for genome, row in zip(genomes, x):
+                self.known[genome_codec.canonical_key(genome)] = (row, None)
+            self.screened = 0
+            return np.arange(min(n_children, len(genomes)))
+        predicted = self.model.predict(x)
+        for genome, row, prediction in zip(genomes, x, predicted.tolist()):
+            self.known[genome_codec.canonical_key(genome)] = (row, prediction)
+        kept = np.sort(np.argsort(-predicted, kind="stable")[:n_children])
+        self.screened = len(genomes) - len(kept)
+        return kept
+
+    def learn(self, genomes, fitness):
+        #train on the simulated genomes and their fitness; returns the record of the generation: rank correlation of the
+        #predictions with the fitness (of the screened genomes, predicted before the model saw them), children dropped, samples
+        x, predicted, actual = [], [], []
+        for genome, genome_fitness in zip(genomes, fitness):
+            row, prediction = self.known.get(genome_codec.canonical_key(genome), (None, None))
+            if row is None:
+                row = features(genome, self.n_nodes)
+            if prediction is not None:
+                predicted.append(prediction)
+                actual.append(genome_fitness)
+            x.append(row)
+        record = {"spearman": spearman(predicted, actual), "screened": self.screened, "samples": self.model.samples}
+        if x:
+            self.model.update(x, fitness)
+        self.known = {}
+        return record
+
+    def state(self):
+        #what a checkpoint needs to continue with the same model
+        return {"weight": self.model.weight, "samples": self.model.samples, "sums": self.model.sums, "products": self.model.products}
+
+    def restore(self, state):
+        self.model.weight, self.model.samples = state["weight"], state["samples"]
+        self.model.sums, self.model.products = np.array(state["sums"]), np.array(state["products"])
+        if self.model.weight > 0:
+            self.model.fit()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The array engines against the object model, on networks with repeated connections (run with pytest)."""
+
+import numpy as np
+
+from network import Network, NoiseControl
+from array_network import Topology, ArrayNetwork, EnsembleNetwork
+
+
+def _compare(network, array_networks, values, steps=20):
+    #runs the object model and the array engines from the same values, with the same noise, and compares them at every step
+    rng = np.random.default_rng(0)
+    for node, value in zip(network.nodes, values.tolist()):
+        node.value = value
+    for array_network in array_networks:
+        array_network.apply_regular_noise(values)
+    for step in range(steps):
+        noise = rng.integers(-20, 20, network.n_nodes)
+        NoiseControl.apply_random_noise(network, noise)
+        transfers = network.run(45, 55)
+        deaths = network.update_network(40, 60, 3)
+        expected = [node.value for node in network.nodes]
+        alive = [node.is_alive for node in network.nodes]
+        for array_network in array_networks:
+            array_network.apply_random_noise(noise)
+            assert np.all(array_network.run(45, 55) == transfers)
+            assert np.all(array_network.update_network(40, 60, 3) == deaths)
+            for row, row_alive in zip(np.atleast_2d(array_network.values).tolist(), np.atleast_2d(array_network.is_alive).tolist()):
+                assert row == expected
+                assert row_alive == alive
+
+
+def test_repeated_edges():
+    #the connections dict of a Node keeps a repeated edge once
+    topology = Topology.from_edges(3, [0, 1, 0, 1], [1, 0, 1, 0])
+    assert topology.indptr.tolist() == [0, 1, 2, 2] and topology.indices.tolist() == [1, 0]
+
+    network = Network(3)
+    network.initialize_from_edges(np.array([0, 0]), np.array([1, 1]))
+    array_network = ArrayNetwork(topology)
+    array_network.values[:] = [0.1, 5.0, 1.0]
+    assert array_network.run(0.5, 2.0) == 1
+    _compare(network, [ArrayNetwork(topology), EnsembleNetwork(topology, 2)], np.array([30.0, 70.0, 50.0]))
+
+
+def test_repeated_genes():
+    assert Topology.from_genome(3, [0, 0, 2]).indices.tolist() == [1, 0, 2, 1]
+
+    rng = np.random.default_rng(1)
+    n_nodes = 30
+    genome = rng.integers(0, n_nodes * (n_nodes - 1) // 2, 60)
+    genome = np.concatenate((genome, genome[::3])) #every third gene twice
+    network = Network(n_nodes)
+    network.initialize_from_genome(genome)
+    _compare(network, [ArrayNetwork.from_genome(n_nodes, genome), EnsembleNetwork.from_genome(n_nodes, genome, 2)],
+             rng.integers(20, 80, n_nodes).astype(np.float64))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Pre-generated networks, shared by every candidate of a test."""
+
+import random
+import numpy as np
+from shared_array import SharedArray
+from array_network import Topology
+
+
+class TopologyBank:
+    """n_tests networks of one generator (create_net_func(func_args), see rules_evolution.py), generated once and
+        stored in shared memory as compact CSR edge arrays. bank[j] is the Topology of the test j, over views of the
+        shared arrays (nothing is copied or computed again): every candidate is tested on the same networks, and pool
+        workers map the arrays instead of generating their own networks.
+        The classes of network.py draw from the random module: with seeding (see seeding.py), it is seeded with the stream of
+        each test before its network is generated, so the networks only depend on the master seed.
+        Parameters: create_net_func, func_args, n_tests, seeding"""
+    def __init__(self, create_net_func, func_args, n_tests, seeding=None):
+        topologies = []
+        for j in range(n_tests):
+            if seeding is not None:
+                random.seed(seeding.integer(j))
+            topologies.append(Topology.from_network(create_net_func(func_args)))
+        self.n_nodes = topologies[0].n_nodes
+        self.fully_connected = topologies[0].fully_connected
+        self.stencils = [topology.stencil for topology in topologies] #regular topologies keep their stencil kernel
+
+        #the networks one after the other: the connections of test j are indices[edges[j]:edges[j+1]]
+        edges = np.cumsum([0] + [len(topology.indices) for topology in topologies])
+        dtype = np.int32 if max(edges[-1], self.n_nodes) < 2**31 else np.int64
+        self.edges = SharedArray((n_tests + 1,), np.int64)
+        self.indptr = SharedArray((n_tests, self.n_nodes + 1), dtype)
+        self.indices = SharedArray((max(edges[-1], 1),), dtype)
+        self.sources = SharedArray((max(edges[-1], 1),), dtype) #see Topology.sources
+        self.edges[:] = edges
+        for j, topology in enumerate(topologies):
+            self.indptr[j] = topology.indptr
+            self.indices[edges[j]:edges[j+1]] = topology.indices
+            self.sources[edges[j]:edges[j+1]] = topology.sources
+
+    def __getitem__(self, test):
+        first, last = self.edges[test], self.edges[test + 1]
+        return Topology(self.n_nodes, self.indptr[test], self.indices[first:last], self.fully_connected, self.stencils[test],
+                        self.sources[first:last])
+
+    def __len__(self):
+        return len(self.indptr)
+
+    def release(self):
+        #free the shared memory, once no worker needs the networks anymore
+        self.edges.release()
+        self.indptr.release()
+        self.indices.release()
+        self.sources.release()